@@ -1,4 +1,3 @@
-import random
 from flask import (
     Flask,
     render_template,
@@ -8,26 +7,67 @@ from flask import (
     session,
     flash,
     jsonify,
+    Response,
+    stream_with_context,
 )
 import numpy as np
+import pandas as pd
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from flask_sqlalchemy import SQLAlchemy
 from functools import wraps
-import pandas as pd
 import os
-import plotly.express as px
-import plotly.io as pio
-import json
-import logging
+import time
+import uuid
 from datetime import datetime
 from recommender import (
     generate_recommendations,
-    should_trigger_recommender,
     get_cached_recommendations,
-    RECOMMENDER_CACHE_PATH,
+    recommendations_version,
+    render_recommendations,
+)
+from ingest import check_header, ingest_upload
+from jobs import submit_job, submit_unique_job, get_job
+from dataset_summary import dataset_summary, refresh_summary
+from dataset_charts import CHARTS, chart_json, refresh_chart_aggregates
+from dataset_cube import get_cube, query_cube
+from knowledge_graph import get_graph, graph_neighbors, graph_overview
+from response_cache import cached_response
+from dataset_query import (
+    DATA_MAX_PAGE,
+    DATA_MAX_STREAM,
+    resolve_columns,
+    query_dataset,
+    to_records,
+    iter_ndjson,
+    to_arrow_ipc,
+)
+from recommendation_query import query_recommendations
+from similar_users import similar_users
+from user_clusters import (
+    cluster_profiles,
+    clusters_of,
+    clusters_stale,
+    refresh_clusters,
+)
+from dataset_store import (
+    ensure_store,
+    workbook_changed,
+    read_dataset,
+    dataset_tag,
+    dataset_version,
+    stored_version,
+    memory_report,
+    DatasetSnapshot,
 )
 
+# Snapshots and the recommendation cache hand every request a shallow copy of
+# one shared frame; with Copy-on-Write a view that writes into its copy gets
+# private column data instead of mutating what other requests are reading.
+# Set for the server process here rather than on import of the data modules,
+# so scripts and workers importing them keep pandas' default semantics.
+pd.set_option("mode.copy_on_write", True)
+
 app = Flask(__name__)
 app.secret_key = "your_secret_key_here"
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///play_members.db"
@@ -36,61 +76,6 @@ app.config["UPLOAD_FOLDER"] = "uploads"
 
 db = SQLAlchemy(app)
 
-DATA_FILE = "Data/play_data.xlsx"
-dataset_cache = {"df": None}
-
-EXPECTED_COLUMNS = [
-    "ID",
-    "Name",
-    "Email",
-    "Phone",
-    "Age",
-    "Gender",
-    "Income Level",
-    "Device Type",
-    "Android Version",
-    "App Name",
-    "Developer",
-    "Category",
-    "Sub_Category",
-    "Free/Paid",
-    "In-App Purchases",
-    "App Size (MB)",
-    "Total Installs",
-    "Transaction ID",
-    "Transaction Type",
-    "App/Game Price",
-    "Discount Applied",
-    "Promo Code Used",
-    "Price Paid (with Coupon)",
-    "Amount Spent on In-App Purchases",
-    "Time Spent (min)",
-    "Session Count",
-    "Time Since Last Use (days)",
-    "Favorite Flag",
-    "Uninstalled",
-    "Date",
-    "Time",
-    "Day of Week",
-    "Weekend",
-    "Season",
-    "Rating",
-    "Review Text",
-    "Review Sentiment",
-    "Review Length",
-    "Demographic Location",
-    "State",
-    "Country",
-    "Region",
-    "Play Pass Plan",
-    "Play Pass User",
-    "Subscription Duration",
-    "Auto-Renew",
-    "App Tags",
-    "Age Rating",
-    "Device Locale/Language",
-]
-
 # Dummy colors for visualization
 COLOR_MAP = {
     "User": "#4F46E5",
@@ -107,68 +92,107 @@ class PlayMember(db.Model):
     password = db.Column(db.String(255))
 
 
-def save_charts_to_disk(charts, filepath="chart_cache.json"):
-    with open(filepath, "w") as f:
-        json.dump(charts, f)
-
-
-def load_charts_from_disk(filepath="chart_cache.json"):
-    if os.path.exists(filepath):
-        with open(filepath, "r") as f:
-            return json.load(f)
-    return None
-
-
 # Global dataset cache with lock for thread safety
 from threading import Lock
 
-dataset_cache = {"df": None, "lock": Lock()}
+dataset_cache = {
+    "df": None,
+    "snapshot": None,
+    "lock": Lock(),  # Guards the swap only, never a load
+    "build_lock": Lock(),  # One snapshot build at a time
+    "loaded_at": None,
+    "refresh_job": None,
+}
 
 
-def load_dataset():
-    with dataset_cache["lock"]:
+def load_dataset(force=False):
+    # Double-buffered: the next snapshot is built off to the side while readers
+    # keep serving the current one, then swapped in under a short lock.
+    if dataset_cache["snapshot"] is not None and not force:
+        return True  # Already loaded
+
+    with dataset_cache["build_lock"]:
+        current = dataset_cache["snapshot"]
         try:
-            if dataset_cache["df"] is not None:
-                return True  # Already loaded
+            version = dataset_version()
+            if current is not None and (not force or current.version == version):
+                return True  # Loaded meanwhile, or already up to date
 
             print("Loading dataset...")
-            df = pd.read_excel(DATA_FILE)
-
-            # Clean column names
-            df.columns = [col.strip() for col in df.columns]
-
+            df = read_dataset()
             print(f"Loaded dataset with {df.shape[0]} rows and {df.shape[1]} columns.")
-            if df.empty:
-                raise ValueError("Dataset is empty.")
-
-            # Validate and reorder columns
-            if set(df.columns) != set(EXPECTED_COLUMNS):
-                missing = set(EXPECTED_COLUMNS) - set(df.columns)
-                extra = set(df.columns) - set(EXPECTED_COLUMNS)
-                raise ValueError(
-                    f"Dataset structure mismatch. Missing: {missing}, Extra: {extra}"
-                )
-
-            df = df[EXPECTED_COLUMNS]  # Reorder to expected
-            df = df.replace({np.nan: None, np.inf: None, -np.inf: None})
-            dataset_cache["df"] = df
-            app.logger.info("Dataset loaded and cached successfully.")
-            return True
-
+            app.logger.info(f"Dataset memory: {memory_report(df)['total_mb']} MB")
+            snapshot = DatasetSnapshot(df, version)
         except Exception as e:
+            # Keep serving the previous snapshot, if any
             app.logger.error(f"Failed to load dataset: {str(e)}")
-            dataset_cache["df"] = None
-            return False
+            return current is not None
+
+        with dataset_cache["lock"]:
+            dataset_cache["snapshot"] = snapshot
+            dataset_cache["df"] = df
+            dataset_cache["loaded_at"] = datetime.now().isoformat()
+        app.logger.info(f"Dataset version {version} loaded and cached successfully.")
+        return True
+
+
+def refresh_dataset_async():
+    # Reuses a refresh that is already queued or running
+    dataset_cache["refresh_job"] = submit_unique_job("refresh", _refresh_dataset_job)
+    return dataset_cache["refresh_job"]
+
+
+def _refresh_dataset_job(progress):
+    ensure_store()  # Rebuilds from a changed workbook here, off the request path
+    if not load_dataset(force=True):
+        raise RuntimeError("Failed to refresh dataset.")
+    refresh_summary()
+    refresh_chart_aggregates()
+    get_cube()
+    refresh_clusters()
+    return {"version": dataset_cache["snapshot"].version}
+
+
+WORKBOOK_CHECK_SECONDS = 2  # How often requests look for a changed workbook
+_workbook_checked = [0.0]
+
+
+@app.before_request
+def check_workbook():
+    # A changed workbook is rebuilt by the refresh job; requests keep being
+    # served from the current store and snapshot meanwhile
+    now = time.monotonic()
+    if now - _workbook_checked[0] < WORKBOOK_CHECK_SECONDS:
+        return
+    _workbook_checked[0] = now
+    if workbook_changed():
+        refresh_dataset_async()
+
+
+def json_safe(frame):
+    # NaN/NA/inf -> None. (DataFrame.replace with None trips a pandas 2.2
+    # Copy-on-Write bug, so go through object dtype instead.)
+    frame = frame.astype(object)
+    return frame.where(frame.notna() & ~frame.isin([np.inf, -np.inf]), None)
+
+
+def get_snapshot():
+    snapshot = dataset_cache["snapshot"]
+    if snapshot is None:
+        if not load_dataset():
+            raise RuntimeError("Failed to load dataset.")
+        snapshot = dataset_cache["snapshot"]
+    return snapshot
 
 
 def get_dataset():
-    with dataset_cache["lock"]:
-        if dataset_cache["df"] is None:
-            if not load_dataset():
-                raise RuntimeError("Failed to load dataset.")
-        return dataset_cache[
-            "df"
-        ].copy()  # Return a copy to prevent accidental modification
+    # Read-only view of the current snapshot; writes stay private to the caller
+    return get_snapshot().df
+
+
+def dataset_content_version():
+    # Store identity/version plus the snapshot this process is serving
+    return f"{dataset_tag()}.{get_snapshot().version}"
 
 
 def login_required(f):
@@ -198,26 +222,140 @@ def get_chart_meta():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/api/dataset/memory")
+@login_required
+def dataset_memory():
+    return jsonify(memory_report(get_snapshot().df))
+
+
 @app.route("/api/data")
+@cached_response(dataset_content_version)
 def api_data():
-    if dataset_cache.get("df") is None:
-        if not load_dataset():
-            return jsonify({"error": "Failed to load dataset"}), 500
+    # ?columns=a,b  ?start=&length= or ?after=<cursor> (empty for the first
+    # page; the next one is in "next")  ?search=  ?sort=&direction=
+    # ?format=json|ndjson|arrow  (DataTables' search[value]/order[0][...] work too)
+    try:
+        snapshot = get_snapshot()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
+
+    args = request.args
+    fmt = args.get("format", "json")
+    if fmt not in ("json", "ndjson", "arrow"):
+        return jsonify({"error": f"Unknown format '{fmt}'"}), 400
+
+    sort = args.get("sort")
+    direction = args.get("direction", "asc")
+    if sort is None and args.get("order[0][column]") is not None:
+        sort = args.get(f"columns[{args.get('order[0][column]')}][data]")
+        direction = args.get("order[0][dir]", "asc")
+
+    try:
+        columns = resolve_columns(snapshot, args.get("columns"))
+        page, matching, next_cursor = query_dataset(
+            snapshot,
+            columns=columns,
+            search=args.get("search", args.get("search[value]", "")),
+            sort=sort,
+            descending=direction == "desc",
+            start=args.get("start", 0, type=int),
+            length=args.get("length", 100, type=int),
+            after=args.get("after"),
+            max_length=DATA_MAX_PAGE if fmt == "json" else DATA_MAX_STREAM,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    headers = {"X-Total-Count": str(len(snapshot)), "X-Matching-Count": str(matching)}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    if fmt == "arrow":
+        return Response(
+            to_arrow_ipc(page),
+            mimetype="application/vnd.apache.arrow.stream",
+            headers=headers,
+        )
+    if fmt == "ndjson":
+        return Response(
+            stream_with_context(iter_ndjson(page)),
+            mimetype="application/x-ndjson",
+            headers=headers,
+        )
 
-    df = dataset_cache["df"]
+    body = {
+        "data": to_records(page),
+        "recordsTotal": len(snapshot),
+        "recordsFiltered": matching,
+        "next": next_cursor,
+    }  # DataTables' draw comes back in cached_response's X-Draw header
+    response = jsonify(body)
+    response.headers.update(headers)
+    return response
 
-    # Get pagination params
-    start = int(request.args.get("start", 0))
-    length = int(request.args.get("length", 100))
 
-    # Slice the DataFrame
-    page = df.iloc[start : start + length]
+@app.route("/api/users/<int:user_id>/similar")
+@login_required
+def similar_users_api(user_id):
+    k = request.args.get("k", 10, type=int)
+    matches = similar_users(user_id, k)
+    if matches is None:
+        return jsonify({"error": f"Unknown user {user_id}"}), 404
+    return jsonify(
+        {
+            "user_id": user_id,
+            "similar": [{"ID": uid, "score": score} for uid, score in matches],
+        }
+    )
 
-    # Sanitize for JSON
-    page = page.replace({np.nan: None, np.inf: None, -np.inf: None})
-    data = page.to_dict(orient="records")
 
-    return jsonify({"data": data, "recordsTotal": len(df), "recordsFiltered": len(df)})
+@app.route("/api/clusters")
+@login_required
+def clusters_api():
+    # Served from the last fit; a missing or outdated one is refitted by a job
+    job_id = refit_clusters_async()
+    profiles = cluster_profiles()
+    return jsonify(
+        {
+            "clusters": profiles,
+            "users": sum(p["size"] for p in profiles),
+            "job_id": job_id,
+        }
+    )
+
+
+def refit_clusters_async():
+    # Job id of the refit when the clusters lag the dataset, else None
+    if not clusters_stale():
+        return None
+    return submit_unique_job("clusters", _refit_clusters_job)
+
+
+def _refit_clusters_job(progress):
+    return {"clusters": len(refresh_clusters()[2])}
+
+
+@app.route("/api/cube")
+@login_required
+@cached_response(dataset_content_version)
+def cube_api():
+    # ?group_by=Region,Category  ?where=Region:Europe&where=Region:Asia
+    # (values of one dimension are OR'ed, dimensions are AND'ed)
+    group_by = [
+        name.strip()
+        for name in request.args.get("group_by", "").split(",")
+        if name.strip()
+    ]
+    filters = {}
+    for condition in request.args.getlist("where"):
+        name, sep, value = condition.partition(":")
+        if not sep:
+            return jsonify({"error": f"Invalid filter '{condition}'"}), 400
+        filters.setdefault(name.strip(), []).append(value)
+    try:
+        groups = query_cube(filters, group_by)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"group_by": group_by, "filters": filters, "groups": groups})
 
 
 @app.route("/")
@@ -228,10 +366,25 @@ def index():
 @app.route("/refresh_data", methods=["POST"])
 @login_required
 def refresh_data():
-    success = load_dataset()
-    if success:
-        return jsonify({"status": "success", "message": "Data refreshed!"})
-    return jsonify({"status": "error", "message": "Failed to refresh dataset."})
+    job_id = refresh_dataset_async()
+    return jsonify(
+        {"status": "success", "message": "Data refresh started.", "job_id": job_id}
+    )
+
+
+@app.route("/dataset/status")
+@login_required
+def dataset_status():
+    snapshot = dataset_cache["snapshot"]
+    return jsonify(
+        {
+            "version": snapshot.version if snapshot is not None else None,
+            "rows": len(snapshot) if snapshot is not None else 0,
+            "loaded_at": dataset_cache["loaded_at"],
+            "store_version": stored_version(),
+            "refresh": get_job(dataset_cache["refresh_job"] or ""),
+        }
+    )
 
 
 @app.route("/register", methods=["GET", "POST"])
@@ -261,7 +414,8 @@ def login():
         user = PlayMember.query.filter_by(username=username).first()
         if user and check_password_hash(user.password, password):
             session["user_id"] = user.id
-            load_dataset()
+            if dataset_cache["snapshot"] is None:
+                refresh_dataset_async()
             return redirect(url_for("dashboard"))
         flash("Invalid credentials", "danger")
     return render_template("login.html")
@@ -277,78 +431,43 @@ def logout():
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    df = get_dataset()
-    if df is None:
-        load_dataset()
-        df = dataset_cache["df"]
-
+    # Materialized aggregates only; rows load lazily through /api/data
+    stats = dataset_summary()
     summary = {
-        "total_users": df["ID"].nunique(),
-        "total_revenue": round(df["Price Paid (with Coupon)"].sum(), 2),
-        "avg_session": round(df["Time Spent (min)"].mean(), 2),
-        "active_regions": df["Region"].nunique(),
+        "total_users": stats["total_users"],
+        "total_revenue": stats["total_revenue"],
+        "avg_session": stats["avg_session"],
+        "active_regions": stats["active_regions"],
         # get count of recommendations
         "total_recommendations": len(get_cached_recommendations()),
     }
 
-    category_list = sorted(df["Category"].dropna().unique().tolist())
-    region_list = sorted(df["Region"].dropna().unique().tolist())
-
     return render_template(
         "dashboard.html",
         summary=summary,
-        category_list=category_list,
-        region_list=region_list,
-        data=df.to_dict(orient="records"),
+        category_list=stats["categories"],
+        region_list=stats["regions"],
     )
 
 
 @app.route("/get_charts", methods=["GET"])
 @login_required
+@cached_response(dataset_content_version)
 def get_charts():
-    if request.args.get("refresh") != "true":
-        cached = load_charts_from_disk()
-        if cached:
-            return jsonify(cached)
-
+    # ?chart=<name> returns just that chart, so the page can draw each one
+    # as soon as it is ready; without it every chart is returned
+    name = request.args.get("chart")
     try:
-        df = dataset_cache.get("df")
-        if df is None:
-            load_dataset()
-            df = dataset_cache["df"]
-        if list(df.columns) != EXPECTED_COLUMNS:
-            return jsonify({"error": "Dataset structure mismatch"})
-
-        cat_data = df["Category"].value_counts().nlargest(10).reset_index()
-        cat_data.columns = ["Category", "count"]
-
-        cat_fig = px.bar(cat_data, x="Category", y="count", title="Top 10 Categories")
-        play_fig = px.pie(df, names="Play Pass User", title="Play Pass Breakdown")
-        inapp_fig = px.bar(
-            df.groupby("Category")["Amount Spent on In-App Purchases"]
-            .mean()
-            .reset_index(),
-            x="Category",
-            y="Amount Spent on In-App Purchases",
-            title="Avg In-App Purchase",
-        )
-        rating_fig = px.histogram(df, x="Rating", title="Ratings")
-
-        charts = {
-            "cat_chart": pio.to_json(cat_fig),
-            "play_chart": pio.to_json(play_fig),
-            "inapp_chart": pio.to_json(inapp_fig),
-            "rating_chart": pio.to_json(rating_fig),
-        }
-
-        save_charts_to_disk(charts)
-        return jsonify(charts)
-
+        if name:
+            return jsonify({name: chart_json(name)})
+        return jsonify({chart: chart_json(chart) for chart in CHARTS})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
 
         print(traceback.format_exc())
-        return jsonify({"error": str(e)})
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route("/upload", methods=["POST"])
@@ -359,39 +478,76 @@ def upload():
         flash("No file uploaded", "warning")
         return redirect(url_for("dashboard"))
 
-    filename = secure_filename(file.filename)
+    # Unique name so concurrent uploads of the same file don't clobber each other
+    filename = f"{uuid.uuid4().hex[:8]}_{secure_filename(file.filename)}"
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
     filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
     file.save(filepath)
 
+    # Reject a wrong file on its header row, before any data is parsed
     try:
-        df = pd.read_excel(filepath)
-        if list(df.columns) != EXPECTED_COLUMNS:
-            dataset_cache["df"] = df
-            flash("Uploaded file structure doesn't match expected dataset.", "danger")
-        else:
-            df.to_excel(DATA_FILE, index=False)
-            flash("Dataset updated!", "success")
+        check_header(filepath)
     except Exception as e:
-        flash(f"Error processing file: {e}", "danger")
+        os.remove(filepath)
+        flash(f"Uploaded file structure doesn't match expected dataset: {e}", "danger")
+        return redirect(url_for("dashboard"))
 
+    job_id = submit_job("upload", _ingest_upload_job, filepath)
+    flash(
+        f"Upload accepted and is being processed (job {job_id}). "
+        f"Check /upload/status/{job_id} for progress.",
+        "info",
+    )
     return redirect(url_for("dashboard"))
 
 
+def _ingest_upload_job(filepath, progress):
+    try:
+        result = ingest_upload(filepath, progress=progress)
+    finally:
+        os.remove(filepath)
+    load_dataset(force=True)
+    refresh_summary()  # Folds just the appended rows into the dashboard totals
+    refresh_chart_aggregates()
+    get_cube()
+    refresh_clusters()
+    return result
+
+
+@app.route("/upload/status/<job_id>")
+@login_required
+def upload_status(job_id):
+    job = get_job(job_id)
+    if job is None or job["kind"] != "upload":
+        return jsonify({"error": "Unknown upload job"}), 404
+    return jsonify(job)
+
+
 @app.route("/run_recommender", methods=["POST"])
 @login_required
 def run_recommender():
-    try:
-        recs_df = generate_recommendations()
-        recs_df.attrs["row_count"] = pd.read_excel(DATA_FILE).shape[0]
-        recs_df.to_pickle(RECOMMENDER_CACHE_PATH)
-        return jsonify(
-            {
-                "status": "success",
-                "message": f"{len(recs_df)} recommendations generated.",
-            }
-        )
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)})
+    # Concurrent triggers share the run that is already queued or running
+    job_id = submit_unique_job("recommender", _recommender_job)
+    return jsonify(
+        {"status": "success", "message": "Recommender run started.", "job_id": job_id}
+    )
+
+
+def _recommender_job(progress):
+    recs_df = generate_recommendations(progress=progress)
+    return {
+        "recommendations": len(recs_df),
+        "message": f"{len(recs_df)} recommendations generated.",
+    }
+
+
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
 
 
 @app.route("/recommendations")
@@ -405,6 +561,7 @@ def recommendations():
                 "warning",
             )
             return render_template("recommendations.html", recommendations=[])
+        recs = render_recommendations(recs)
 
         # Make sure all required columns exist for recommendations
         required_columns = ["User ID", "Recommended App", "Category", "Why Play Pass?"]
@@ -417,26 +574,11 @@ def recommendations():
         recommendations = recs.to_dict(orient="records")
 
         # Calculate visualization data with error handling
-        full_df = get_dataset()
-        visualization_data = {}
+        snapshot = get_snapshot()
 
         # Age data calculation
         try:
-            if "Age Group" in full_df.columns:
-                age_data = full_df["Age Group"].value_counts().sort_index().to_dict()
-            else:
-                # Create age groups if only 'Age' column exists
-                if "Age" in full_df.columns:
-                    full_df["Age Group"] = pd.cut(
-                        full_df["Age"],
-                        bins=[0, 18, 25, 35, 50, 100],
-                        labels=["0-18", "19-25", "26-35", "36-50", "50+"],
-                    )
-                    age_data = (
-                        full_df["Age Group"].value_counts().sort_index().to_dict()
-                    )
-                else:
-                    age_data = {"0-18": 0, "19-25": 0, "26-35": 0, "36-50": 0, "50+": 0}
+            age_data = snapshot.column("Age Group").value_counts().sort_index().to_dict()
         except Exception as e:
             app.logger.error(f"Error calculating age data: {str(e)}")
             age_data = {"0-18": 0, "19-25": 0, "26-35": 0, "36-50": 0, "50+": 0}
@@ -444,8 +586,8 @@ def recommendations():
         # Region data calculation
         try:
             region_data = (
-                full_df["Region"].value_counts().nlargest(10).to_dict()
-                if "Region" in full_df.columns
+                snapshot.column("Region").value_counts().nlargest(10).to_dict()
+                if "Region" in snapshot.columns
                 else {"North": 0, "South": 0, "East": 0, "West": 0}
             )
         except Exception as e:
@@ -455,8 +597,8 @@ def recommendations():
         # Category data calculation
         try:
             category_data = (
-                full_df["Category"].value_counts().nlargest(10).to_dict()
-                if "Category" in full_df.columns
+                snapshot.column("Category").value_counts().nlargest(10).to_dict()
+                if "Category" in snapshot.columns
                 else {"Games": 0, "Productivity": 0, "Entertainment": 0}
             )
         except Exception as e:
@@ -505,111 +647,51 @@ def graph_visualization():
 
 @app.route("/api/graph_data")
 @login_required
+@cached_response(dataset_content_version, recommendations_version)
 def graph_data():
-    import networkx as nx
-    import pickle
-
-    # Load full dataset
-    df = dataset_cache.get("df")
-    if df is None:
-        load_dataset()
-        df = dataset_cache["df"]
-
-    # Load recommendations
-    try:
-        with open("recommender_cache.pkl", "rb") as f:
-            recs = pickle.load(f)
-    except FileNotFoundError:
+    # Built and serialized once per recommendation version
+    graph = get_graph()
+    if graph is None:
         return jsonify({"error": "Recommendation cache not found"}), 500
+    return Response(graph["payload"], mimetype="application/json")
 
-    # Build Knowledge Graph
-    G = nx.Graph()
-
-    for _, row in recs.iterrows():
-        user = f"user_{row['User ID']}"
-        app = f"app_{row['Recommended App']}"
-        category = f"cat_{row['Category']}"
-        reason = f"reason_{row['Why Play Pass?']}"
-
-        G.add_node(user, type="user")
-        G.add_node(app, type="app")
-        G.add_node(category, type="category")
-        G.add_node(reason, type="reason")
-
-        G.add_edge(user, app)
-        G.add_edge(app, category)
-        G.add_edge(app, reason)
-
-    # Create mapping of user IDs to names from the dataset
-    user_names = {}
-    for _, row in df.iterrows():
-        user_id = f"user_{row['ID']}"
-        user_names[user_id] = row.get("Name", f"User {row['ID']}")
-
-    nodes = []
-    for n in G.nodes:
-        node_data = {"id": n, "type": G.nodes[n]["type"]}
-        if n.startswith("user_") and n in user_names:
-            node_data["name"] = user_names[n]
-        nodes.append(node_data)
-
-    edges = [{"source": u, "target": v} for u, v in G.edges]
 
-    # Optimized graph data generation
+@app.route("/api/graph/overview")
+@login_required
+@cached_response(dataset_content_version, recommendations_version)
+def graph_overview_api():
+    # ?limit=500  ?types=user,app,category  ?collapse=category|offer
+    args = request.args
+    types = [kind for kind in args.get("types", "").split(",") if kind]
     try:
-        # Combine duplicate nodes and edges
-        unique_nodes = {}
-        for node in nodes:
-            unique_nodes[node["id"]] = node
-
-        # Combine duplicate edges
-        unique_edges = {}
-        for edge in edges:
-            key = f"{edge['source']}-{edge['target']}"
-            unique_edges[key] = edge
-
-        # Simplify user groups structure
-        optimized_user_groups = {}
-        for _, row in recs.iterrows():
-            user_id = f"user_{row['User ID']}"
-            offers = row["Suggested Offers"]
-            offers = [offers] if not isinstance(offers, (list, np.ndarray)) else offers
-
-            for offer in offers:
-                if pd.notna(offer):
-                    offer_str = str(offer).strip()
-                    if offer_str not in optimized_user_groups:
-                        optimized_user_groups[offer_str] = set()
-                    optimized_user_groups[offer_str].add(user_id)
-
-        # Convert sets to lists for JSON serialization
-        user_groups = {k: list(v) for k, v in optimized_user_groups.items()}
-
-        # Return optimized response
-        return jsonify(
-            {
-                "graph": {
-                    "nodes": list(unique_nodes.values()),
-                    "edges": list(unique_edges.values()),
-                    "total_nodes": len(nodes),
-                    "total_edges": len(edges),
-                },
-                "user_groups": user_groups,
-                "status": "success",
-            }
-        )
-
-    except Exception as e:
-        app.logger.error(f"Error generating optimized graph data: {str(e)}")
-        return (
-            jsonify(
-                {"error": "Failed to generate optimized graph data", "details": str(e)}
-            ),
-            500,
+        view = graph_overview(
+            limit=args.get("limit", 500, type=int),
+            types=types or None,
+            collapse=args.get("collapse") or None,
         )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if view is None:
+        return jsonify({"error": "Recommendation cache not found"}), 500
+    return jsonify(view)
 
 
-recommendations_df = get_cached_recommendations()
+@app.route("/api/graph/neighbors")
+@login_required
+@cached_response(dataset_content_version, recommendations_version)
+def graph_neighbors_api():
+    # ?node=<id>&depth=1  ?start=&length= page through large neighbourhoods
+    args = request.args
+    node = args.get("node", "")
+    view = graph_neighbors(
+        node,
+        depth=args.get("depth", 1, type=int),
+        start=args.get("start", 0, type=int),
+        length=args.get("length", 100, type=int),
+    )
+    if view is None:
+        return jsonify({"error": f"Unknown node '{node}'"}), 404
+    return jsonify(view)
 
 
 def generate_user_app_graph():
@@ -618,7 +700,7 @@ def generate_user_app_graph():
     seen_users = set()
     seen_apps = set()
 
-    for _, row in recommendations_df.iterrows():
+    for _, row in get_cached_recommendations().iterrows():
         uid = str(row["User ID"])
         app = row["Recommended App"]
 
@@ -651,7 +733,7 @@ def generate_app_category_graph():
     seen_apps = set()
     seen_categories = set()
 
-    for _, row in recommendations_df.iterrows():
+    for _, row in get_cached_recommendations().iterrows():
         app = row["Recommended App"]
         category = row["Category"]
 
@@ -688,7 +770,7 @@ def generate_app_offer_graph():
     seen_apps = set()
     seen_offers = set()
 
-    for _, row in recommendations_df.iterrows():
+    for _, row in render_recommendations(get_cached_recommendations()).iterrows():
         app = row["Recommended App"]
         offer = row["Suggested Offers"]
 
@@ -721,7 +803,7 @@ def generate_user_offer_graph():
     seen_users = set()
     seen_offers = set()
 
-    for _, row in recommendations_df.iterrows():
+    for _, row in render_recommendations(get_cached_recommendations()).iterrows():
         uid = str(row["User ID"])
         offer = row["Suggested Offers"]
 
@@ -749,14 +831,14 @@ def generate_user_offer_graph():
 
 
 def generate_user_cluster_graph():
-    # Simulated clusters for demo; in real case use ML or clustering logic
+    # Users from the recommendations, linked to their k-means cluster
     nodes = []
     edges = []
-    seen_users = set()
-    num_clusters = 5
-    cluster_ids = [f"Cluster {i+1}" for i in range(num_clusters)]
+    refit_clusters_async()
+    profiles = cluster_profiles()
 
-    for cluster in cluster_ids:
+    for profile in profiles:
+        cluster = f"Cluster {profile['cluster'] + 1}"
         nodes.append(
             {
                 "data": {
@@ -768,19 +850,18 @@ def generate_user_cluster_graph():
             }
         )
 
-    for _, row in recommendations_df.iterrows():
-        uid = str(row["User ID"])
-        cluster = random.choice(cluster_ids)
-
-        if uid not in seen_users:
-            nodes.append(
-                {
-                    "data": {"id": f"user_{uid}", "label": uid, "type": "User"},
-                    "classes": "user",
-                }
-            )
-            seen_users.add(uid)
-
+    user_ids = get_cached_recommendations()["User ID"].dropna().unique()
+    for uid, label in zip(user_ids, clusters_of(user_ids)):
+        if label < 0:
+            continue
+        uid = str(uid)
+        cluster = f"Cluster {label + 1}"
+        nodes.append(
+            {
+                "data": {"id": f"user_{uid}", "label": uid, "type": "User"},
+                "classes": "user",
+            }
+        )
         edges.append(
             {"data": {"source": f"user_{uid}", "target": f"cluster_{cluster}"}}
         )
@@ -794,7 +875,7 @@ def merchant_panel():
     if recs.empty:
         return render_template("merchant_panel.html", recommendations=[], loaded=False)
 
-    recs = recs.to_dict(orient="records")  # List of dicts
+    recs = render_recommendations(recs).to_dict(orient="records")  # List of dicts
     return render_template("merchant_panel.html", recommendations=recs, loaded=True)
 
 
@@ -819,38 +900,30 @@ def submit_merchant_action():
 
 @app.route("/api/recommendations", methods=["POST"])
 @login_required
+@cached_response(dataset_content_version, recommendations_version)
 def get_recommendations_data():
     try:
         # Get DataTables parameters
-        start = request.json.get("start", 0)
-        length = request.json.get("length", 25)
-        filters = request.json.get("filters", {})
-
-        # Get recommendations
-        recs = get_cached_recommendations()
-
-        # Apply filters
-        if filters.get("region"):
-            recs = recs[recs["Region"] == filters["region"]]
-        if filters.get("age"):
-            recs = recs[recs["Age Group"] == filters["age"]]
-        if filters.get("category"):
-            recs = recs[recs["Category"] == filters["category"]]
-
-        # Calculate total records
-        total_records = len(recs)
-
-        # Paginate
-        paginated_recs = recs.iloc[start : start + length]
+        params = request.get_json(silent=True) or {}
+        page, filtered, total = query_recommendations(
+            filters=params.get("filters", {}),
+            search=params.get("search", ""),
+            sort=params.get("sort"),
+            descending=params.get("direction") == "desc",
+            start=params.get("start", 0),
+            length=params.get("length", 25),
+        )
 
         return jsonify(
             {
-                "data": paginated_recs.to_dict("records"),
-                "recordsTotal": total_records,
-                "recordsFiltered": total_records,
+                "data": json_safe(page).to_dict("records"),
+                "recordsTotal": total,
+                "recordsFiltered": filtered,
             }
         )
 
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         app.logger.error(f"Error in recommendations API: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,157 @@
+import json
+import os
+from threading import Lock
+
+import plotly.express as px
+import plotly.io as pio
+
+from dataset_store import dataset_tag, read_delta, read_tagged_dataset
+
+# Dashboard charts are drawn from small aggregates (counts and sums per
+# label), never from the rows themselves, so a figure carries only its bins.
+# The aggregates are mergeable: appended rows are folded in from the delta.
+CHART_AGGREGATES_PATH = "dataset_charts.json"
+CHART_COLUMNS = [
+    "Category",
+    "Play Pass User",
+    "Amount Spent on In-App Purchases",
+    "Rating",
+]
+TOP_CATEGORIES = 10
+
+_charts = {"tag": None, "state": None, "figures": {}, "lock": Lock()}
+
+
+def _counts(series):
+    return {str(k): int(v) for k, v in series.value_counts().items() if v}
+
+
+def _aggregate(df):
+    inapp = df.groupby("Category", observed=True)["Amount Spent on In-App Purchases"]
+    return {
+        "category_counts": _counts(df["Category"]),
+        "play_pass_counts": _counts(df["Play Pass User"]),
+        "inapp_sum": {str(k): float(v) for k, v in inapp.sum().items()},
+        "inapp_count": {str(k): int(v) for k, v in inapp.count().items()},
+        "rating_counts": _counts(df["Rating"]),
+    }
+
+
+def _merge(state, delta):
+    merged = {}
+    for name, values in state.items():
+        merged[name] = dict(values)
+        for key, value in delta[name].items():
+            merged[name][key] = merged[name].get(key, 0) + value
+    return merged
+
+
+def _save(state, tag):
+    with open(CHART_AGGREGATES_PATH + ".tmp", "w") as f:
+        json.dump({"dataset_tag": tag, "aggregates": state}, f)
+    os.replace(CHART_AGGREGATES_PATH + ".tmp", CHART_AGGREGATES_PATH)
+
+
+def _load():
+    if not os.path.exists(CHART_AGGREGATES_PATH):
+        return None, None
+    with open(CHART_AGGREGATES_PATH, "r") as f:
+        document = json.load(f)
+    return document.get("dataset_tag"), document.get("aggregates")
+
+
+def _refresh(tag):
+    # (tag, aggregates), like dataset_summary: a full recompute may land on a
+    # newer tag than the one asked for, and is saved under that one
+    saved_tag, state = _charts["tag"], _charts["state"]
+    if state is None:
+        saved_tag, state = _load()
+    if saved_tag == tag:
+        return tag, state
+
+    delta = read_delta(saved_tag, tag, CHART_COLUMNS) if saved_tag else None
+    if delta is not None:
+        print(f"Updating chart aggregates with {len(delta)} appended rows.")
+        state = _merge(state, _aggregate(delta))
+    else:
+        print("Computing chart aggregates...")
+        tag, df = read_tagged_dataset(CHART_COLUMNS)
+        state = _aggregate(df)
+    _save(state, tag)
+    return tag, state
+
+
+def refresh_chart_aggregates():
+    # Brings the aggregates up to the current dataset version; rendered
+    # figures of an older version are dropped
+    tag = dataset_tag()
+    with _charts["lock"]:
+        if _charts["tag"] != tag:
+            _charts["tag"], _charts["state"] = _refresh(tag)
+            _charts["figures"] = {}
+        return _charts["state"]
+
+
+def _category_chart(state):
+    counts = sorted(state["category_counts"].items(), key=lambda kv: -kv[1])
+    top = counts[:TOP_CATEGORIES]
+    return px.bar(
+        x=[label for label, _ in top],
+        y=[count for _, count in top],
+        labels={"x": "Category", "y": "count"},
+        title="Top 10 Categories",
+    )
+
+
+def _play_pass_chart(state):
+    counts = state["play_pass_counts"]
+    return px.pie(
+        names=list(counts), values=list(counts.values()), title="Play Pass Breakdown"
+    )
+
+
+def _inapp_chart(state):
+    counts = state["inapp_count"]
+    categories = [c for c in sorted(counts) if counts[c]]
+    means = [state["inapp_sum"][c] / counts[c] for c in categories]
+    return px.bar(
+        x=categories,
+        y=means,
+        labels={"x": "Category", "y": "Amount Spent on In-App Purchases"},
+        title="Avg In-App Purchase",
+    )
+
+
+def _rating_chart(state):
+    # Ratings are integers, so one bar per value is the histogram
+    counts = sorted((int(k), v) for k, v in state["rating_counts"].items())
+    fig = px.bar(
+        x=[rating for rating, _ in counts],
+        y=[count for _, count in counts],
+        labels={"x": "Rating", "y": "count"},
+        title="Ratings",
+    )
+    return fig.update_layout(bargap=0)
+
+
+CHARTS = {
+    "cat_chart": _category_chart,
+    "play_chart": _play_pass_chart,
+    "inapp_chart": _inapp_chart,
+    "rating_chart": _rating_chart,
+}
+
+
+def chart_json(name):
+    # Plotly JSON for one chart, rendered on first request per dataset version
+    if name not in CHARTS:
+        raise ValueError(f"Unknown chart '{name}'")
+    state = refresh_chart_aggregates()
+    with _charts["lock"]:
+        figure = _charts["figures"].get(name)
+    if figure is None:
+        figure = pio.to_json(CHARTS[name](state))
+        with _charts["lock"]:
+            if _charts["state"] is state:
+                _charts["figures"][name] = figure
+    return figure
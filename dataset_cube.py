@@ -0,0 +1,193 @@
+from itertools import combinations
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from dataset_store import DERIVED_COLUMNS, dataset_tag, read_tagged_dataset
+
+# 🧊 Group-by cube over the low-cardinality dimensions, built once per dataset
+# version. Every cuboid of up to CUBE_DENSE_DIMENSIONS dimensions is kept as a
+# dense array, so most drilldowns are a slice and a sum; wider queries
+# aggregate the cube's non-empty base cells instead of the rows.
+CUBE_DIMENSIONS = [
+    "Category",
+    "Sub_Category",
+    "Region",
+    "Country",
+    "Season",
+    "Device Type",
+    "Income Level",
+    "Play Pass Plan",
+    "Age Group",
+]
+CUBE_MEASURES = {
+    "revenue": "Price Paid (with Coupon)",
+    "in_app_spend": "Amount Spent on In-App Purchases",
+    "time_spent": "Time Spent (min)",
+}
+CUBE_SOURCE_COLUMNS = (
+    [name for name in CUBE_DIMENSIONS if name not in DERIVED_COLUMNS]
+    + ["Age"]
+    + list(CUBE_MEASURES.values())
+)  # Age Group is derived from Age
+CUBE_DENSE_DIMENSIONS = 2
+
+# Last axis of every cube array: row count, then (sum, non-null count) per
+# measure so averages skip missing values
+_SLOTS = ["rows"] + [slot for name in CUBE_MEASURES for slot in (name, f"{name}_count")]
+
+_cube = {"tag": None, "cube": None, "lock": Lock()}
+
+
+def build_cube(df):
+    labels, codes = {}, {}
+    for name in CUBE_DIMENSIONS:
+        column = DERIVED_COLUMNS[name](df) if name in DERIVED_COLUMNS else df[name]
+        categorical = pd.Categorical(column)
+        # Missing values get the last slot, labelled None
+        labels[name] = [str(c) for c in categorical.categories] + [None]
+        dim_codes = categorical.codes.astype("int64")
+        codes[name] = np.where(dim_codes < 0, len(labels[name]) - 1, dim_codes)
+
+    values = np.empty((len(df), len(_SLOTS)))
+    values[:, 0] = 1
+    for i, column in enumerate(CUBE_MEASURES.values()):
+        measure = df[column].to_numpy("float64", na_value=np.nan)
+        present = ~np.isnan(measure)
+        values[:, 1 + 2 * i] = np.where(present, measure, 0)
+        values[:, 2 + 2 * i] = present
+
+    # Base cuboid: one cell per distinct combination that occurs
+    shape = tuple(len(labels[name]) for name in CUBE_DIMENSIONS)
+    keys = np.ravel_multi_index([codes[name] for name in CUBE_DIMENSIONS], shape)
+    cell_keys, inverse = np.unique(keys, return_inverse=True)
+    cell_values = _sum_by(inverse, values, len(cell_keys))
+    cell_codes = dict(zip(CUBE_DIMENSIONS, np.unravel_index(cell_keys, shape)))
+
+    dense = {}
+    for depth in range(CUBE_DENSE_DIMENSIONS + 1):
+        for dims in combinations(CUBE_DIMENSIONS, depth):
+            sizes = tuple(len(labels[name]) for name in dims)
+            index = _group_index(
+                [cell_codes[name] for name in dims], sizes, len(cell_keys)
+            )
+            cells = _sum_by(index, cell_values, int(np.prod(sizes)))
+            dense[dims] = cells.reshape(sizes + (len(_SLOTS),))
+
+    return {
+        "rows": len(df),
+        "labels": labels,
+        "lookup": {
+            name: {label: code for code, label in enumerate(dim_labels)}
+            for name, dim_labels in labels.items()
+        },
+        "cell_codes": cell_codes,
+        "cell_values": cell_values,
+        "dense": dense,
+    }
+
+
+def _group_index(codes, sizes, count):
+    # Flat group number per cell; everything is one group with no dimensions
+    if not codes:
+        return np.zeros(count, dtype="int64")
+    return np.ravel_multi_index(codes, sizes)
+
+
+def _sum_by(index, values, size):
+    return np.column_stack(
+        [
+            np.bincount(index, weights=values[:, i], minlength=size)
+            for i in range(values.shape[1])
+        ]
+    )
+
+
+def get_cube():
+    tag = dataset_tag()
+    with _cube["lock"]:
+        if _cube["tag"] != tag:
+            print("Building dataset cube...")
+            # Cached under the tag of the rows actually read
+            tag, df = read_tagged_dataset(CUBE_SOURCE_COLUMNS)
+            _cube["cube"] = build_cube(df)
+            _cube["tag"] = tag
+        return _cube["cube"]
+
+
+def _filter_codes(cube, filters):
+    # {dimension: [labels]} -> {dimension: code array}; unknown labels match
+    # nothing
+    codes = {}
+    for name, values in filters.items():
+        lookup = cube["lookup"][name]
+        codes[name] = np.array(
+            [lookup[v] for v in values if v in lookup], dtype="int64"
+        )
+    return codes
+
+
+def _from_dense(cube, dims, codes, group_by):
+    cells = cube["dense"][dims]
+    for axis, name in enumerate(dims):
+        if name in codes:
+            cells = cells.take(codes[name], axis=axis)
+    summed = tuple(axis for axis, name in enumerate(dims) if name not in group_by)
+    cells = cells.sum(axis=summed)
+    remaining = [name for name in dims if name in group_by]
+    order = [remaining.index(name) for name in group_by]
+    return cells.transpose(order + [len(group_by)])
+
+
+def _from_cells(cube, codes, group_by):
+    cell_codes = cube["cell_codes"]
+    keep = np.ones(len(cube["cell_values"]), dtype=bool)
+    for name, allowed in codes.items():
+        keep &= np.isin(cell_codes[name], allowed)
+    sizes = tuple(len(cube["labels"][name]) for name in group_by)
+    index = _group_index(
+        [cell_codes[name][keep] for name in group_by], sizes, int(keep.sum())
+    )
+    cells = _sum_by(index, cube["cell_values"][keep], int(np.prod(sizes)))
+    return cells.reshape(sizes + (len(_SLOTS),))
+
+
+def query_cube(filters=None, group_by=None):
+    # filters: {dimension: [label, ...]} (labels OR'ed within a dimension,
+    # dimensions AND'ed); group_by: [dimension, ...]. Returns one dict per
+    # non-empty group with the group's labels and its measures.
+    filters = {name: list(values) for name, values in (filters or {}).items()}
+    group_by = list(group_by or [])
+    unknown = [n for n in list(filters) + group_by if n not in CUBE_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(unknown)}")
+    if len(set(group_by)) != len(group_by):
+        raise ValueError("Each dimension can only be grouped once")
+
+    cube = get_cube()
+    codes = _filter_codes(cube, filters)
+    dims = tuple(n for n in CUBE_DIMENSIONS if n in filters or n in group_by)
+    if dims in cube["dense"]:
+        cells = _from_dense(cube, dims, codes, group_by)
+    else:
+        cells = _from_cells(cube, codes, group_by)
+
+    # Built column-wise, then zipped into one dict per non-empty group
+    if not group_by:
+        cells = cells[None]  # The single total, as a group of one
+    present = cells[..., 0] > 0
+    slots = cells[present]
+    columns = {
+        name: np.array(cube["labels"][name], dtype=object)[group_codes].tolist()
+        for name, group_codes in zip(group_by, np.nonzero(present))
+    }
+    columns["rows"] = slots[:, 0].astype("int64").tolist()
+    for i, measure in enumerate(CUBE_MEASURES):
+        total, count = slots[:, 1 + 2 * i], slots[:, 2 + 2 * i]
+        average = np.round(total / np.where(count > 0, count, 1), 2).astype(object)
+        average[count == 0] = None
+        columns[measure] = np.round(total, 2).tolist()
+        columns[f"avg_{measure}"] = average.tolist()
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
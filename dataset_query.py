@@ -0,0 +1,215 @@
+import json
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dataset_store import DERIVED_COLUMNS
+
+# Free-text search looks at these columns (category columns match on their
+# distinct labels only)
+DATA_SEARCH_COLUMNS = [
+    "Name",
+    "Email",
+    "App Name",
+    "Developer",
+    "Category",
+    "Sub_Category",
+    "Region",
+    "Country",
+]
+DATA_MAX_PAGE = 1000  # Rows per JSON page
+DATA_MAX_STREAM = 100000  # Rows per NDJSON / Arrow pull
+SEARCH_CACHE_SIZE = 32
+MISSING_ID_KEY = 2**31  # Rows without an ID sort after every Int32 ID
+
+_search_cache = OrderedDict()
+_search_lock = Lock()
+
+
+def resolve_columns(snapshot, columns):
+    # ?columns=a,b,c -> validated list; every stored column when empty
+    # (derived columns only on request)
+    if not columns:
+        return [name for name in snapshot.columns if name not in DERIVED_COLUMNS]
+    names = [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in names if name not in snapshot.columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return names
+
+
+def _search_hits(snapshot, search):
+    # Row mask for a case-insensitive substring search, or an exact ID
+    hits = np.zeros(len(snapshot), dtype=bool)
+    for name in DATA_SEARCH_COLUMNS:
+        if name not in snapshot.columns:
+            continue
+        values = snapshot.column(name)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            labels = values.cat.categories.astype(str)
+            matched = np.flatnonzero(
+                labels.str.contains(search, case=False, regex=False)
+            )
+            hits |= np.isin(values.cat.codes.to_numpy(), matched)
+        else:
+            hits |= (
+                values.str.contains(search, case=False, regex=False)
+                .fillna(False)
+                .to_numpy(bool)
+            )
+    if search.isdigit():
+        hits |= (snapshot.column("ID") == int(search)).fillna(False).to_numpy(bool)
+    return hits
+
+
+def _memo(key, build):
+    # Small LRU for per-snapshot search results and keyset keys
+    with _search_lock:
+        if key in _search_cache:
+            _search_cache.move_to_end(key)
+            return _search_cache[key]
+    value = build()
+    with _search_lock:
+        _search_cache[key] = value
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+    return value
+
+
+def _candidates(snapshot, search, sort, descending):
+    # Matching row positions in output order
+    if not search:
+        if sort is None:
+            return None  # Every row, in dataset order
+        return snapshot.order_by(sort, descending)
+
+    def build():
+        hits = _search_hits(snapshot, search)
+        if sort is None:
+            return np.flatnonzero(hits)
+        order = snapshot.order_by(sort, descending)
+        return order[hits[order]]
+
+    key = (id(snapshot), snapshot.version, search.lower(), sort, descending)
+    return _memo(key, build)
+
+
+def _keyset_keys(snapshot, search, positions):
+    # (ID, row position) packed into one sortable int64 per candidate row
+    def build():
+        ids = snapshot.column("ID").to_numpy("int64", na_value=MISSING_ID_KEY)
+        return ids[positions] * (len(snapshot) + 1) + positions
+
+    return _memo((id(snapshot), snapshot.version, search.lower(), "keyset"), build)
+
+
+def _parse_cursor(cursor, rows):
+    try:
+        row_id, position = (int(part) for part in cursor.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return row_id * (rows + 1) + position
+
+
+def query_dataset(
+    snapshot,
+    columns=None,
+    search="",
+    sort=None,
+    descending=False,
+    start=0,
+    length=100,
+    after=None,
+    max_length=DATA_MAX_PAGE,
+):
+    # -> (page frame, rows matching, cursor for the next keyset page or None)
+    # `after` switches from offset to keyset pagination on (ID, row position),
+    # which stays stable while rows are appended.
+    columns = columns or resolve_columns(snapshot, None)
+    search = (search or "").strip()
+    length = max(0, min(int(length), max_length))
+    if sort is not None and sort not in snapshot.columns:
+        raise ValueError(f"Cannot sort by '{sort}'")
+    if after is not None:
+        if sort not in (None, "ID") or descending:
+            raise ValueError("Keyset pagination only runs in ascending ID order")
+        sort = "ID"
+
+    candidates = _candidates(snapshot, search, sort, descending)
+    matching = len(snapshot) if candidates is None else len(candidates)
+
+    if after is not None:
+        keys = _keyset_keys(snapshot, search, candidates)
+        begin = 0  # An empty cursor starts from the first row
+        if after:
+            begin = np.searchsorted(keys, _parse_cursor(after, len(snapshot)), "right")
+        positions = candidates[begin : begin + length]
+    else:
+        start = max(0, int(start))
+        if candidates is None:
+            positions = np.arange(start, min(start + length, matching))
+        else:
+            positions = candidates[start : start + length]
+
+    page = pd.DataFrame(
+        {
+            name: snapshot.column(name).iloc[positions].reset_index(drop=True)
+            for name in columns
+        }
+    )
+
+    next_cursor = None
+    if sort == "ID" and not descending and len(positions) == length and length:
+        last = positions[-1]
+        row_id = snapshot.column("ID").iloc[last]
+        row_id = MISSING_ID_KEY if pd.isna(row_id) else int(row_id)
+        next_cursor = f"{row_id}:{int(last)}"
+    return page, matching, next_cursor
+
+
+def column_values(series):
+    # One column -> JSON-ready list: NA/inf -> None, timestamps -> ISO 8601,
+    # float32 values without binary noise
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.dt.strftime("%Y-%m-%dT%H:%M:%S").astype(object)
+        return values.where(series.notna(), None).tolist()
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy("float64", na_value=np.nan)
+        if getattr(series.dtype, "itemsize", 8) == 4:
+            # Through the shortest float32 repr: 157.57, not 157.570007
+            values = values.astype("float32").astype(str).astype("float64")
+        finite = np.isfinite(values)
+        values = values.astype(object)
+        values[~finite] = None
+        return values.tolist()
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def to_columns(page):
+    return {name: column_values(page[name]) for name in page.columns}
+
+
+def to_records(page):
+    # Serialized column by column, then zipped into row objects
+    columns = to_columns(page)
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def iter_ndjson(page, chunk_rows=5000):
+    for start in range(0, len(page), chunk_rows):
+        chunk = page.iloc[start : start + chunk_rows]
+        lines = [json.dumps(row, ensure_ascii=False) for row in to_records(chunk)]
+        yield "\n".join(lines) + "\n"
+
+
+def to_arrow_ipc(page):
+    table = pa.Table.from_pandas(page, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
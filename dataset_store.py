@@ -0,0 +1,692 @@
+import glob
+import hashlib
+import json
+import os
+import uuid
+from threading import Lock, Thread
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATA_FILE = "Data/play_data.xlsx"
+STORE_DIR = "Data/store"
+STORE_META_FILE = os.path.join(STORE_DIR, "play_data.meta.json")
+BASE_FILE_PATTERN = "play_data.base-v{}.parquet"
+SEGMENT_FILE_PATTERN = "play_data.delta-v{}.parquet"
+# User IDs touched by each append, so consumers can catch up incrementally
+USER_LOG_FILE_PATTERN = "play_data.users-v{}.npy"
+USER_LOG_LIMIT = 64
+# Fold delta segments back into the base once this many have piled up
+COMPACT_AFTER_SEGMENTS = int(os.environ.get("PLAYPASS_COMPACT_AFTER", 8))
+
+# "local": every process loads its own pandas copy from Parquet.
+# "shared": the dataset is materialized once into an uncompressed Arrow IPC
+# file and every worker memory-maps it read-only, so the OS page cache holds a
+# single copy no matter how many gunicorn workers are running. Call
+# materialize_shared_dataset() from the master (e.g. gunicorn's on_starting
+# hook) so workers start by mapping an existing file.
+DATASET_MODE = os.environ.get("PLAYPASS_DATASET_MODE", "local")
+SHARED_FILE_PATTERN = os.path.join(STORE_DIR, "play_data.{}.arrow")
+
+# Column -> compact dtype. Low-cardinality text is categorical, free text is
+# Arrow-backed string, numerics are nullable 32-bit so missing values stay NA
+# instead of turning the whole column into Python objects. Money stays 64-bit,
+# the precision Excel holds it in, so totals match the workbook.
+DATASET_SCHEMA = {
+    "ID": "Int32",
+    "Name": "string[pyarrow]",
+    "Email": "string[pyarrow]",
+    "Phone": "string[pyarrow]",
+    "Age": "Int32",
+    "Gender": "category",
+    "Income Level": "category",
+    "Device Type": "category",
+    "Android Version": "category",
+    "App Name": "string[pyarrow]",
+    "Developer": "string[pyarrow]",
+    "Category": "category",
+    "Sub_Category": "category",
+    "Free/Paid": "category",
+    "In-App Purchases": "category",
+    "App Size (MB)": "Float32",
+    "Total Installs": "Int32",
+    "Transaction ID": "string[pyarrow]",
+    "Transaction Type": "category",
+    "App/Game Price": "Float64",
+    "Discount Applied": "category",
+    "Promo Code Used": "category",
+    "Price Paid (with Coupon)": "Float64",
+    "Amount Spent on In-App Purchases": "Float64",
+    "Time Spent (min)": "Int32",
+    "Session Count": "Int32",
+    "Time Since Last Use (days)": "Int32",
+    "Favorite Flag": "category",
+    "Uninstalled": "category",
+    "Date": "datetime64[ns]",
+    "Time": "string[pyarrow]",
+    "Day of Week": "category",
+    "Weekend": "category",
+    "Season": "category",
+    "Rating": "Int32",
+    "Review Text": "string[pyarrow]",
+    "Review Sentiment": "category",
+    "Review Length": "Int32",
+    "Demographic Location": "string[pyarrow]",
+    "State": "category",
+    "Country": "category",
+    "Region": "category",
+    "Play Pass Plan": "category",
+    "Play Pass User": "category",
+    "Subscription Duration": "Int32",
+    "Auto-Renew": "category",
+    "App Tags": "category",
+    "Age Rating": "category",
+    "Device Locale/Language": "category",
+}
+
+EXPECTED_COLUMNS = list(DATASET_SCHEMA)
+SCHEMA_DIGEST = hashlib.sha256(json.dumps(DATASET_SCHEMA).encode()).hexdigest()[:16]
+
+AGE_BINS = [0, 18, 25, 35, 50, 100]
+AGE_LABELS = ["0-18", "19-25", "26-35", "36-50", "50+"]
+
+_store_lock = Lock()
+_append_lock = Lock()
+_compaction_lock = Lock()
+
+# Sorted 64-bit hashes of every stored Transaction ID, kept per process so an
+# append only costs a lookup per new row instead of a rescan of the store.
+_transaction_index = {"version": None, "hashes": None}
+
+
+def _store_path(name):
+    return os.path.join(STORE_DIR, name)
+
+
+def _file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta():
+    if not os.path.exists(STORE_META_FILE):
+        return None
+    with open(STORE_META_FILE, "r") as f:
+        meta = json.load(f)
+    if "base" not in meta or not os.path.exists(_store_path(meta["base"])):
+        return None  # Older store layout or missing files; rebuild
+    return meta
+
+
+def _write_meta(meta):
+    tmp_path = STORE_META_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, STORE_META_FILE)
+
+
+def _retire_files(meta, names):
+    # Files replaced by a rebuild or compaction stay on disk for one more
+    # generation so readers that already picked them up can finish.
+    for name in meta.get("retired", []):
+        try:
+            os.remove(_store_path(name))
+        except OSError:
+            pass
+    meta["retired"] = names
+
+
+def validate_columns(columns):
+    if set(columns) != set(EXPECTED_COLUMNS):
+        missing = set(EXPECTED_COLUMNS) - set(columns)
+        extra = set(columns) - set(EXPECTED_COLUMNS)
+        raise ValueError(
+            f"Dataset structure mismatch. Missing: {missing}, Extra: {extra}"
+        )
+
+
+def _coerce_column(series, dtype):
+    if dtype == "category":
+        # Keep categories as text even when Excel hands back numbers
+        text = series.where(series.isna(), series.astype(str))
+        return text.astype("category")
+    if dtype.startswith("string"):
+        return series.astype(dtype)
+    if dtype.startswith("datetime"):
+        return pd.to_datetime(series).astype(dtype)
+    # Raises ValueError on values that cannot be parsed or cast safely
+    return pd.to_numeric(series).astype(dtype)
+
+
+def apply_schema(df):
+    for col, dtype in DATASET_SCHEMA.items():
+        try:
+            df[col] = _coerce_column(df[col], dtype)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Column '{col}' does not match {dtype}: {e}")
+    return df
+
+
+def memory_report(df):
+    usage = df.memory_usage(deep=True, index=False)
+    return {
+        "rows": len(df),
+        "total_mb": round(usage.sum() / (1024 * 1024), 2),
+        "columns": {
+            col: {
+                "dtype": str(df[col].dtype),
+                "mb": round(usage[col] / (1024 * 1024), 3),
+            }
+            for col in df.columns
+        },
+    }
+
+
+def _clean_frame(df):
+    # Clean column names
+    df.columns = [str(col).strip() for col in df.columns]
+    if df.empty:
+        raise ValueError("Dataset is empty.")
+
+    validate_columns(df.columns)
+    df = df[EXPECTED_COLUMNS]  # Reorder to expected
+    return apply_schema(df)
+
+
+def _to_table(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Use one dictionary type everywhere so base, delta segments and upload
+    # chunks always concatenate, whatever the categories in each of them.
+    fields = [
+        (
+            pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+            if pa.types.is_dictionary(field.type)
+            else field
+        )
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def _write_parquet(table, name):
+    path = _store_path(name)
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_table(meta, columns=None):
+    names = [meta["base"]] + [segment["file"] for segment in meta["segments"]]
+    tables = [pq.read_table(_store_path(name), columns=columns) for name in names]
+    if len(tables) == 1:
+        return tables[0]
+    return pa.concat_tables(tables).unify_dictionaries()
+
+
+def _hash_ids(ids):
+    return pd.util.hash_array(np.asarray(ids, dtype=object))
+
+
+def build_store(source=DATA_FILE):
+    # One-time Excel parse; everything else reads the columnar copy.
+    print(f"Building columnar dataset store from {source}...")
+    df = _clean_frame(pd.read_excel(source))
+    os.makedirs(STORE_DIR, exist_ok=True)
+
+    previous = _read_meta()
+    version = (previous or {}).get("version", 0) + 1
+    table = _to_table(df)
+    retired = []
+    if previous is not None:
+        # Replacing the workbook replaces the dataset, appended batches included
+        retired = [previous["base"]] + [s["file"] for s in previous["segments"]]
+        retired += [entry["file"] for entry in previous.get("user_log", [])]
+
+    base = BASE_FILE_PATTERN.format(version)
+    _write_parquet(table, base)
+
+    stat = os.stat(source)
+    meta = {
+        "version": version,
+        "store_id": (previous or {}).get("store_id") or uuid.uuid4().hex[:12],
+        "source": source,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": _file_digest(source),
+        "rows": table.num_rows,
+        "schema": SCHEMA_DIGEST,
+        "base": base,
+        "base_version": version,
+        "segments": [],
+        "user_log": [],
+        "retired": (previous or {}).get("retired", []),
+    }
+    _retire_files(meta, retired)
+    _write_meta(meta)
+    print(f"Dataset store built with {table.num_rows} rows.")
+    return meta
+
+
+def ensure_store(source=DATA_FILE):
+    # Rebuild only when the workbook really changed: mtime/size is the fast
+    # check, the content hash avoids a rebuild after a plain `touch`/copy.
+    with _store_lock:
+        meta = _read_meta()
+        if not os.path.exists(source):
+            if meta is not None:
+                return meta
+            raise FileNotFoundError(f"Dataset file not found: {source}")
+
+        stat = os.stat(source)
+        if (
+            meta is not None
+            and meta.get("source") == source
+            and meta.get("schema") == SCHEMA_DIGEST
+        ):
+            if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+                return meta
+            if meta["size"] == stat.st_size and meta["sha256"] == _file_digest(source):
+                meta["mtime_ns"] = stat.st_mtime_ns
+                _write_meta(meta)
+                return meta
+
+        return build_store(source)
+
+
+def current_meta():
+    # Store metadata as it is on disk, without looking at the workbook, so
+    # readers never wait on a rebuild; only the refresh job calls
+    # ensure_store(). A store is built here only when there is none at all.
+    meta = _read_meta()
+    return meta if meta is not None else ensure_store()
+
+
+def workbook_changed(source=DATA_FILE):
+    # Cheap stat check for "the workbook may have changed since the store was
+    # built"; ensure_store() makes the real decision
+    meta = _read_meta()
+    if meta is None or meta.get("source") != source or not os.path.exists(source):
+        return False
+    stat = os.stat(source)
+    return (meta["mtime_ns"], meta["size"]) != (stat.st_mtime_ns, stat.st_size)
+
+
+def _transaction_hashes(meta):
+    if _transaction_index["version"] != meta["version"]:
+        ids = _read_table(meta, ["Transaction ID"]).column("Transaction ID")
+        _transaction_index["hashes"] = np.sort(_hash_ids(ids.to_pylist()))
+        _transaction_index["version"] = meta["version"]
+    return _transaction_index["hashes"]
+
+
+def _sorted_contains(sorted_values, values):
+    if len(sorted_values) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_values, values)
+    return sorted_values[np.minimum(positions, len(sorted_values) - 1)] == values
+
+
+def append_batches(batches, progress=None):
+    # Validate batches one at a time, drop transactions already stored and
+    # stream the rest into a single delta segment under a new dataset version.
+    # Memory is bounded by the batch size; cost scales with the upload, not
+    # with the stored dataset. Any invalid batch rejects the whole upload.
+    with _append_lock:
+        meta = _read_meta()
+        if meta is None and os.path.exists(DATA_FILE):
+            meta = ensure_store()
+        hashes = _transaction_hashes(meta) if meta else np.empty(0, np.uint64)
+
+        os.makedirs(STORE_DIR, exist_ok=True)
+        tmp_path = _store_path(f"pending-{os.getpid()}.parquet.tmp")
+        seen = np.empty(0, dtype=np.uint64)
+        user_ids = np.empty(0, dtype=np.int64)
+        received = appended = 0
+        writer = None
+        try:
+            for batch in batches:
+                try:
+                    batch = _clean_frame(batch)
+                except ValueError as e:
+                    raise ValueError(
+                        f"Rows {received + 1}-{received + len(batch)}: {e}"
+                    )
+                received += len(batch)
+
+                # Rows without a Transaction ID are never duplicates
+                missing = batch["Transaction ID"].isna().to_numpy()
+                batch_hashes = _hash_ids(batch["Transaction ID"])
+                new = ~pd.Series(batch_hashes).duplicated().to_numpy()
+                new &= ~_sorted_contains(hashes, batch_hashes)
+                new &= ~np.isin(batch_hashes, seen)
+                new |= missing
+                if new.any():
+                    table = _to_table(batch[new])
+                    if writer is None:
+                        writer = pq.ParquetWriter(tmp_path, table.schema)
+                    writer.write_table(table)
+                    seen = np.union1d(seen, batch_hashes[new & ~missing])
+                    appended += int(new.sum())
+                    user_ids = np.union1d(
+                        user_ids, batch["ID"][new].dropna().to_numpy("int64")
+                    )
+                if progress is not None:
+                    progress(rows=received, appended=appended)
+        except Exception:
+            if writer is not None:
+                writer.close()
+                os.remove(tmp_path)
+            raise
+        if writer is None:
+            return {
+                "version": meta["version"] if meta else None,
+                "appended": 0,
+                "duplicates": received,
+            }
+        writer.close()
+
+        with _store_lock:
+            meta = _read_meta()
+            if meta is None:
+                # Nothing to append to yet: the first upload becomes the base
+                version = 1
+                base = BASE_FILE_PATTERN.format(version)
+                os.replace(tmp_path, _store_path(base))
+                meta = {
+                    "version": version,
+                    "store_id": uuid.uuid4().hex[:12],
+                    "source": DATA_FILE,
+                    "mtime_ns": None,
+                    "size": None,
+                    "sha256": None,
+                    "rows": appended,
+                    "schema": SCHEMA_DIGEST,
+                    "base": base,
+                    "base_version": version,
+                    "segments": [],
+                    "user_log": [],
+                    "retired": [],
+                }
+            else:
+                version = meta["version"] + 1
+                segment = SEGMENT_FILE_PATTERN.format(version)
+                os.replace(tmp_path, _store_path(segment))
+                meta["segments"].append(
+                    {"file": segment, "version": version, "rows": appended}
+                )
+                meta["version"] = version
+                meta["rows"] += appended
+
+                user_log = USER_LOG_FILE_PATTERN.format(version)
+                np.save(_store_path(user_log), user_ids)
+                meta.setdefault("user_log", []).append(
+                    {"file": user_log, "version": version}
+                )
+                for entry in meta["user_log"][:-USER_LOG_LIMIT]:
+                    try:
+                        os.remove(_store_path(entry["file"]))
+                    except OSError:
+                        pass
+                meta["user_log"] = meta["user_log"][-USER_LOG_LIMIT:]
+            _write_meta(meta)
+
+            _transaction_index["hashes"] = np.insert(
+                hashes, np.searchsorted(hashes, seen), seen
+            )
+            _transaction_index["version"] = version
+
+    if len(meta["segments"]) >= COMPACT_AFTER_SEGMENTS:
+        Thread(target=compact_store, daemon=True).start()
+    return {
+        "version": version,
+        "appended": appended,
+        "duplicates": received - appended,
+    }
+
+
+def append_batch(df):
+    return append_batches([df])
+
+
+def compact_store():
+    # Merge delta segments into a new base file. The data (and therefore the
+    # dataset version) is unchanged; only the number of files readers open.
+    # Rows are copied as they are, duplicates included: dropping any here would
+    # change what caches saved under this version counted.
+    with _compaction_lock:
+        meta = _read_meta()
+        if meta is None or not meta["segments"]:
+            return meta
+        compacted = list(meta["segments"])
+        table = _read_table(meta)
+        base = BASE_FILE_PATTERN.format(meta["version"])
+        _write_parquet(table, base)
+
+        with _store_lock:
+            current = _read_meta()
+            if current is None or current["base"] != meta["base"]:
+                return current  # Rebuilt from the workbook meanwhile
+            current["base"] = base
+            current["segments"] = [
+                segment for segment in current["segments"] if segment not in compacted
+            ]
+            _retire_files(current, [meta["base"]] + [s["file"] for s in compacted])
+            _write_meta(current)
+        print(f"Compacted {len(compacted)} dataset segments into {base}.")
+        return current
+
+
+def _shared_file(meta):
+    # Named after the store version so workers still mapping an older version
+    # keep a valid file while a newer one is written next to it.
+    return SHARED_FILE_PATTERN.format(f"v{meta.get('version', 1)}")
+
+
+def materialize_shared_dataset(meta=None):
+    meta = meta or current_meta()
+    path = _shared_file(meta)
+    if os.path.exists(path):
+        return path
+
+    table = _read_table(meta)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    for old_path in glob.glob(SHARED_FILE_PATTERN.format("*")):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass  # Still mapped on platforms that forbid unlinking
+    return path
+
+
+def _shared_types_mapper(arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        return None
+    return pd.ArrowDtype(arrow_type)
+
+
+def _map_shared_dataset(columns=None, meta=None):
+    source = pa.memory_map(materialize_shared_dataset(meta), "r")
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    # Arrow-backed columns wrap the mapped buffers instead of copying them
+    # into NumPy arrays. Dictionary columns still become pandas categoricals;
+    # only their small integer codes are materialized per worker.
+    return table.to_pandas(types_mapper=_shared_types_mapper)
+
+
+def read_dataset(columns=None):
+    # Single entry point for dataset reads; `columns` projects at the file level.
+    return _read_dataset(current_meta(), columns)
+
+
+def read_tagged_dataset(columns=None):
+    # read_dataset() together with the dataset_tag() of exactly the rows read,
+    # both taken from one look at the metadata so an append landing in
+    # between can't be in the rows but missing from the tag
+    meta = current_meta()
+    return _tag(meta), _read_dataset(meta, columns)
+
+
+def _read_dataset(meta, columns):
+    if columns is not None:
+        columns = list(columns)
+    if DATASET_MODE == "shared":
+        return _map_shared_dataset(columns, meta)
+    return _read_table(meta, columns).to_pandas(types_mapper=_local_types_mapper)
+
+
+def _local_types_mapper(arrow_type):
+    # Arrow strings come back as string[python] by default; keep the
+    # string[pyarrow] that DATASET_SCHEMA declares
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def dataset_row_count():
+    return current_meta()["rows"]
+
+
+def dataset_version():
+    return current_meta().get("version", 1)
+
+
+def dataset_tag():
+    # Version plus store identity, for caches persisted outside the store:
+    # a wiped and rebuilt store restarts at version 1.
+    return _tag(current_meta())
+
+
+def _tag(meta):
+    return f"{meta.get('store_id', 'store')}.v{meta.get('version', 1)}"
+
+
+def changed_user_ids(tag):
+    # IDs of users whose rows changed after the dataset version in `tag`
+    # (see dataset_tag()), or None when that can't be told from the user log:
+    # another store, a workbook rebuild since, or log entries pruned.
+    meta = current_meta()
+    store_id, _, version = tag.rpartition(".v")
+    if store_id != meta.get("store_id") or not version.isdigit():
+        return None
+    version = int(version)
+    if version < meta.get("base_version", meta["version"]):
+        return None
+
+    entries = [e for e in meta.get("user_log", []) if e["version"] > version]
+    if len(entries) != meta["version"] - version:
+        return None
+    ids = [np.load(_store_path(entry["file"])) for entry in entries]
+    return np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+
+
+def read_delta(since_tag, until_tag, columns=None):
+    # Rows appended after the dataset version in `since_tag` up to and
+    # including the one in `until_tag` (see dataset_tag()), or None when they
+    # are no longer separate: another store, a workbook rebuild since, or the
+    # segments compacted into the base. The upper bound keeps an append that
+    # lands while a caller works out of rows it will save under `until_tag`.
+    meta = current_meta()
+    store_id, since, until = _tag_versions(since_tag, until_tag)
+    if store_id != meta.get("store_id") or since is None or until > meta["version"]:
+        return None
+    segments = [s for s in meta["segments"] if since < s["version"] <= until]
+    expected = list(range(since + 1, until + 1))
+    if [segment["version"] for segment in segments] != expected:
+        return None
+    if not segments:
+        return pd.DataFrame(columns=columns)
+    tables = [pq.read_table(_store_path(s["file"]), columns=columns) for s in segments]
+    table = pa.concat_tables(tables).unify_dictionaries()
+    return table.to_pandas(types_mapper=_local_types_mapper)
+
+
+def _tag_versions(since_tag, until_tag):
+    # (store id, since, until) when both tags name one store, else (None, None, None)
+    store_id, _, since = since_tag.rpartition(".v")
+    until_store_id, _, until = until_tag.rpartition(".v")
+    if store_id != until_store_id or not (since.isdigit() and until.isdigit()):
+        return None, None, None
+    return store_id, int(since), int(until)
+
+
+def stored_version():
+    # Version on disk right now, without rebuilding from the workbook
+    meta = _read_meta()
+    return meta["version"] if meta is not None else None
+
+
+def _age_group(df):
+    return pd.cut(df["Age"], bins=AGE_BINS, labels=AGE_LABELS)
+
+
+# Columns computed on demand from a snapshot and kept in its overlay
+DERIVED_COLUMNS = {
+    "Age Group": _age_group,
+}
+
+
+class DatasetSnapshot:
+    # Immutable view of one dataset version. Derived columns are computed once
+    # per snapshot and live in an overlay instead of being written into the
+    # shared frame.
+
+    def __init__(self, df, version):
+        self._df = df
+        self.version = version
+        self._overlay = {}
+        self._lock = Lock()
+
+    @property
+    def df(self):
+        # Shallow copy: O(columns), never O(rows). Only safe to write into
+        # with Copy-on-Write on, which app.py turns on for the server process.
+        return self._df.copy(deep=False)
+
+    @property
+    def columns(self):
+        return list(self._df.columns) + list(DERIVED_COLUMNS)
+
+    def __len__(self):
+        return len(self._df)
+
+    def column(self, name):
+        if name in self._df.columns:
+            return self._df[name]
+        with self._lock:
+            if name not in self._overlay:
+                if name not in DERIVED_COLUMNS:
+                    raise KeyError(name)
+                self._overlay[name] = DERIVED_COLUMNS[name](self._df)
+            return self._overlay[name]
+
+    def order_by(self, name, descending=False):
+        # Stable row positions sorted by a column, NA last; cached per snapshot
+        key = ("order", name, descending)
+        with self._lock:
+            cached = self._overlay.get(key)
+        if cached is None:
+            values = self.column(name)
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Sort by label, not by the order categories were first seen
+                values = values.cat.reorder_categories(
+                    sorted(values.cat.categories, key=str)
+                )
+            cached = values.array.argsort(
+                ascending=not descending, kind="stable", na_position="last"
+            )
+            with self._lock:
+                self._overlay[key] = cached
+        return cached
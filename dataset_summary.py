@@ -0,0 +1,112 @@
+import json
+import os
+from threading import Lock
+
+import numpy as np
+
+from dataset_store import dataset_tag, read_delta, read_tagged_dataset
+
+# Materialized dashboard aggregates, kept per dataset version. The state holds
+# only mergeable parts (sums, counts, distinct sets), so appended rows are
+# folded in without rereading the dataset.
+SUMMARY_PATH = "dataset_summary.json"
+SUMMARY_USERS_PATH = "dataset_summary.users.npy"  # Distinct IDs, sorted
+SUMMARY_COLUMNS = [
+    "ID",
+    "Price Paid (with Coupon)",
+    "Time Spent (min)",
+    "Region",
+    "Category",
+]
+
+_summary = {"tag": None, "state": None, "lock": Lock()}
+
+
+def _partial(df):
+    time_spent = df["Time Spent (min)"].to_numpy("float64", na_value=np.nan)
+    return {
+        "rows": len(df),
+        "users": np.unique(df["ID"].dropna().to_numpy("int64")),
+        "revenue": float(
+            np.nansum(df["Price Paid (with Coupon)"].to_numpy("float64", na_value=0))
+        ),
+        "time_spent_sum": float(np.nansum(time_spent)),
+        "time_spent_count": int(np.count_nonzero(~np.isnan(time_spent))),
+        "regions": sorted(str(v) for v in df["Region"].dropna().unique()),
+        "categories": sorted(str(v) for v in df["Category"].dropna().unique()),
+    }
+
+
+def _merge(state, delta):
+    return {
+        "rows": state["rows"] + delta["rows"],
+        "users": np.union1d(state["users"], delta["users"]),
+        "revenue": state["revenue"] + delta["revenue"],
+        "time_spent_sum": state["time_spent_sum"] + delta["time_spent_sum"],
+        "time_spent_count": state["time_spent_count"] + delta["time_spent_count"],
+        "regions": sorted(set(state["regions"]) | set(delta["regions"])),
+        "categories": sorted(set(state["categories"]) | set(delta["categories"])),
+    }
+
+
+def _save(state, tag):
+    np.save(SUMMARY_USERS_PATH + ".tmp.npy", state["users"])
+    os.replace(SUMMARY_USERS_PATH + ".tmp.npy", SUMMARY_USERS_PATH)
+    document = {key: value for key, value in state.items() if key != "users"}
+    with open(SUMMARY_PATH + ".tmp", "w") as f:
+        json.dump({**document, "dataset_tag": tag}, f)
+    os.replace(SUMMARY_PATH + ".tmp", SUMMARY_PATH)
+
+
+def _load():
+    if not (os.path.exists(SUMMARY_PATH) and os.path.exists(SUMMARY_USERS_PATH)):
+        return None, None
+    with open(SUMMARY_PATH, "r") as f:
+        document = json.load(f)
+    tag = document.pop("dataset_tag")
+    return tag, {**document, "users": np.load(SUMMARY_USERS_PATH)}
+
+
+def _refresh(tag):
+    # Returns (tag, state) for the tag the state was actually computed at:
+    # `tag` itself when folding in a delta, or whatever was current when a
+    # full recompute read the rows
+    saved_tag, state = _summary["tag"], _summary["state"]
+    if state is None:
+        saved_tag, state = _load()
+    if saved_tag == tag:
+        return tag, state
+
+    delta = read_delta(saved_tag, tag, SUMMARY_COLUMNS) if saved_tag else None
+    if delta is not None:
+        print(f"Updating dataset summary with {len(delta)} appended rows.")
+        state = _merge(state, _partial(delta))
+    else:
+        print("Computing dataset summary...")
+        tag, df = read_tagged_dataset(SUMMARY_COLUMNS)
+        state = _partial(df)
+    _save(state, tag)
+    return tag, state
+
+
+def refresh_summary():
+    # Brings the summary up to the current dataset version
+    tag = dataset_tag()
+    with _summary["lock"]:
+        if _summary["tag"] != tag:
+            _summary["tag"], _summary["state"] = _refresh(tag)
+        return _summary["state"]
+
+
+def dataset_summary():
+    state = refresh_summary()
+    count = state["time_spent_count"]
+    return {
+        "rows": state["rows"],
+        "total_users": len(state["users"]),
+        "total_revenue": round(state["revenue"], 2),
+        "avg_session": round(state["time_spent_sum"] / count, 2) if count else None,
+        "active_regions": len(state["regions"]),
+        "categories": state["categories"],
+        "regions": state["regions"],
+    }
@@ -0,0 +1,102 @@
+import csv
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+from dataset_store import append_batches, validate_columns
+
+UPLOAD_CHUNK_ROWS = 5000
+SUPPORTED_UPLOADS = (".xlsx", ".csv", ".parquet")
+
+
+def _extension(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in SUPPORTED_UPLOADS:
+        raise ValueError(
+            f"Unsupported file type '{ext}'. Use one of: {', '.join(SUPPORTED_UPLOADS)}"
+        )
+    return ext
+
+
+def _header_columns(header):
+    # (position, name) of every real column; empty cells (e.g. a formatted
+    # but blank trailing header cell) are not columns
+    columns = [
+        (i, "" if col is None else str(col).strip()) for i, col in enumerate(header)
+    ]
+    return [(i, name) for i, name in columns if name]
+
+
+def _raw_header(path):
+    # Header cells as written; only touches the first row (or the Parquet footer)
+    ext = _extension(path)
+    if ext == ".xlsx":
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(max_row=1, values_only=True)
+            header = next(rows, ())
+        finally:
+            workbook.close()
+    elif ext == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            header = next(csv.reader(f), [])
+    else:
+        header = pq.read_schema(path).names
+    return header
+
+
+def read_header(path):
+    return [name for _, name in _header_columns(_raw_header(path))]
+
+
+def check_header(path):
+    # Raises ValueError before any row is parsed
+    validate_columns(read_header(path))
+
+
+def iter_chunks(path, chunk_rows=UPLOAD_CHUNK_ROWS):
+    ext = _extension(path)
+    if ext == ".xlsx":
+        workbook = load_workbook(path, read_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            positions, header = zip(*_header_columns(next(rows)))
+            chunk = []
+            for row in rows:
+                values = [row[i] if i < len(row) else None for i in positions]
+                if all(value is None for value in values):
+                    continue  # Trailing blank rows
+                chunk.append(values)
+                if len(chunk) == chunk_rows:
+                    yield pd.DataFrame(chunk, columns=header)
+                    chunk = []
+            if chunk:
+                yield pd.DataFrame(chunk, columns=header)
+        finally:
+            workbook.close()
+    elif ext == ".csv":
+        # Read as text; the schema registry does the typing per chunk.
+        # Columns are picked by position and named the way read_header()
+        # names them, so " Name " passes here as it did the header check.
+        positions = [i for i, _ in _header_columns(_raw_header(path))]
+        for chunk in pd.read_csv(
+            path,
+            chunksize=chunk_rows,
+            dtype=str,
+            encoding="utf-8-sig",
+            usecols=positions,
+        ):
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk
+    else:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            chunk = batch.to_pandas()
+            chunk.columns = chunk.columns.str.strip()
+            yield chunk
+
+
+def ingest_upload(path, progress=None):
+    check_header(path)
+    return append_batches(iter_chunks(path), progress=progress)
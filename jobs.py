@@ -0,0 +1,105 @@
+import os
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+JOB_WORKERS = int(os.environ.get("PLAYPASS_JOB_WORKERS", 2))
+JOB_HISTORY = 100  # Finished jobs kept for status lookups
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = Lock()
+
+
+def _prune_jobs():
+    finished = [job for job in _jobs.values() if job["finished"] is not None]
+    finished.sort(key=lambda job: job["finished"])
+    for job in finished[: max(0, len(finished) - JOB_HISTORY)]:
+        del _jobs[job["id"]]
+
+
+def _end_stage(job, now):
+    if job["stages"] and job["stages"][-1]["seconds"] is None:
+        stage = job["stages"][-1]
+        stage["seconds"] = round(now - stage["started"], 3)
+
+
+def _new_job(kind, fn, args, kwargs):
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "kind": kind,
+        "status": "queued",
+        "progress": {},
+        "stages": [],
+        "result": None,
+        "error": None,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+    }
+
+    def progress(**fields):
+        # A new "stage" value closes the previous stage's timing
+        with _jobs_lock:
+            stage = fields.get("stage")
+            if stage is not None and stage != job["progress"].get("stage"):
+                now = time.time()
+                _end_stage(job, now)
+                job["stages"].append({"name": stage, "started": now, "seconds": None})
+            job["progress"].update(fields)
+
+    def run():
+        job["started"] = time.time()
+        job["status"] = "running"
+        try:
+            job["result"] = fn(*args, progress=progress, **kwargs)
+            job["status"] = "done"
+        except Exception as e:
+            print(traceback.format_exc())
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            with _jobs_lock:
+                job["finished"] = time.time()
+                _end_stage(job, job["finished"])
+
+    return job, run
+
+
+def submit_job(kind, fn, *args, **kwargs):
+    # Runs fn(*args, progress=callback, **kwargs) off the request thread;
+    # progress(**fields) merges fields into the job's status.
+    job, run = _new_job(kind, fn, args, kwargs)
+    with _jobs_lock:
+        _prune_jobs()
+        _jobs[job["id"]] = job
+    _executor.submit(run)
+    return job["id"]
+
+
+def submit_unique_job(kind, fn, *args, **kwargs):
+    # Like submit_job, but returns the id of a queued/running job of the same
+    # kind instead of starting a second one
+    job, run = _new_job(kind, fn, args, kwargs)
+    with _jobs_lock:
+        for other in _jobs.values():
+            if other["kind"] == kind and other["status"] in ("queued", "running"):
+                return other["id"]
+        _prune_jobs()
+        _jobs[job["id"]] = job
+    _executor.submit(run)
+    return job["id"]
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        return {
+            **job,
+            "progress": dict(job["progress"]),
+            "stages": [dict(stage) for stage in job["stages"]],
+        }
@@ -0,0 +1,349 @@
+import json
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from dataset_store import dataset_tag, read_dataset
+from recommender import OFFER_SETS, REASONS, SPEND_REASON, recommendations_snapshot
+
+# 🕸️ User -> app -> category/reason graph of the current recommendations.
+# Nodes are numbered by type (users first, then apps, categories, reasons),
+# so every edge runs from a lower to a higher node number.
+NODE_TYPES = ["user", "app", "category", "reason"]
+GRAPH_MAX_DEPTH = 3
+GRAPH_MAX_NODES = 1000  # Nodes per response; the browser can't draw many more
+GRAPH_COLLAPSE = ["category", "offer"]  # Ways to fold users into groups
+NODE_PREFIXES = {
+    "user": "user_",
+    "app": "app_",
+    "category": "cat_",
+    "reason": "reason_",
+}
+
+_graph = {"key": None, "graph": None, "lock": Lock()}
+
+
+def _user_names():
+    # Name per user ID (their last row, as before), indexed for lookups
+    df = read_dataset(["ID", "Name"])
+    df = df[df["ID"].notna()].drop_duplicates("ID", keep="last")
+    return pd.Series(df["Name"].to_numpy(), index=df["ID"].to_numpy("int64"))
+
+
+def _reason_codes(recs):
+    # Reason text per row (spenders' text carries their amount), factorized
+    # over the distinct (reason, amount) pairs instead of rendered per row
+    codes = recs["Reason Code"].to_numpy()
+    amounts = np.where(codes == 0, recs["Total Spent"].to_numpy("float64"), np.nan)
+    pairs, distinct = pd.factorize(pd.MultiIndex.from_arrays([codes, amounts]))
+    texts = [
+        SPEND_REASON.format(amount) if code == 0 else REASONS[code]
+        for code, amount in distinct
+    ]
+    # Amounts that print the same share one node
+    text_codes, labels = pd.factorize(pd.Index(texts))
+    return text_codes[pairs], labels
+
+
+def _csr(sources, targets, n_nodes):
+    # Undirected adjacency: neighbours of node i are indices[indptr[i]:indptr[i+1]]
+    rows = np.concatenate([sources, targets])
+    cols = np.concatenate([targets, sources])
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_nodes + 1, dtype="int64")
+    np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+    return indptr, cols[order].astype("int32")
+
+
+def _user_groups(user_nodes, offer_codes, node_ids):
+    # Offer text -> users recommended any offer set containing it
+    members = {}
+    for code, offers in enumerate(OFFER_SETS):
+        users = np.unique(user_nodes[offer_codes == code])
+        for offer in offers:
+            members.setdefault(offer.strip(), []).append(users)
+    return {
+        offer: node_ids[np.unique(np.concatenate(users))].tolist()
+        for offer, users in members.items()
+        if sum(len(u) for u in users)
+    }
+
+
+def build_graph(recs, user_names):
+    user_codes, user_ids = pd.factorize(recs["User ID"].astype("int64"))
+    app_codes, apps = pd.factorize(recs["Recommended App"].astype(str))
+    category_codes, categories = pd.factorize(recs["Category"].astype(str))
+    reason_codes, reasons = _reason_codes(recs)
+
+    # Node numbering: one contiguous block per type
+    blocks = [user_ids, apps, categories, reasons]
+    offsets = np.cumsum([0] + [len(block) for block in blocks])
+    node_ids = np.concatenate(
+        [
+            np.array([f"{NODE_PREFIXES[kind]}{value}" for value in block], dtype=object)
+            for kind, block in zip(NODE_TYPES, blocks)
+        ]
+    )
+    node_types = np.repeat(
+        np.arange(len(NODE_TYPES), dtype="int8"), [len(b) for b in blocks]
+    )
+
+    user_nodes = user_codes + offsets[0]
+    app_nodes = app_codes + offsets[1]
+    sources = np.concatenate([user_nodes, app_nodes, app_nodes])
+    targets = np.concatenate(
+        [app_nodes, category_codes + offsets[2], reason_codes + offsets[3]]
+    )
+    n_nodes = int(offsets[-1])
+    edge_keys = np.unique(sources.astype("int64") * n_nodes + targets)
+    sources, targets = np.divmod(edge_keys, n_nodes)
+    indptr, indices = _csr(sources, targets, n_nodes)
+
+    # Users are the first block, so user i is node i
+    names = user_names.reindex(user_ids.to_numpy()).to_numpy(object)
+    named = pd.notna(names)
+    nodes = [
+        {"id": node_id, "type": NODE_TYPES[t]}
+        for node_id, t in zip(node_ids, node_types)
+    ]
+    for position in np.flatnonzero(named):
+        nodes[position]["name"] = names[position]
+
+    payload = json.dumps(
+        {
+            "graph": {
+                "nodes": nodes,
+                "edges": [
+                    {"source": source, "target": target}
+                    for source, target in zip(
+                        node_ids[sources].tolist(), node_ids[targets].tolist()
+                    )
+                ],
+                "total_nodes": n_nodes,
+                "total_edges": len(edge_keys),
+            },
+            "user_groups": _user_groups(
+                user_nodes, recs["Offer Code"].to_numpy(), node_ids
+            ),
+            "status": "success",
+        }
+    ).encode()
+
+    # Recommendation pairs, kept for collapsing users into groups
+    pair_keys, first = np.unique(
+        user_nodes.astype("int64") * n_nodes + app_nodes, return_index=True
+    )
+    app_categories = np.empty(len(apps), dtype="int64")
+    app_categories[app_codes] = category_codes + offsets[2]
+
+    return {
+        "node_ids": node_ids,
+        "node_types": node_types,
+        "offsets": offsets,
+        "names": names,
+        "indptr": indptr,
+        "indices": indices,
+        "degree": np.diff(indptr),
+        "lookup": pd.Index(node_ids),
+        "pairs": (
+            pair_keys // n_nodes,
+            pair_keys % n_nodes,
+            recs["Offer Code"].to_numpy()[first],
+        ),
+        "app_categories": app_categories,
+        "total_edges": len(edge_keys),
+        "payload": payload,
+    }
+
+
+def get_graph():
+    # Built once per recommendation version (and dataset version, for the
+    # names); None while there are no recommendations
+    version, recs = recommendations_snapshot()
+    key = (version, dataset_tag())
+    with _graph["lock"]:
+        if _graph["key"] != key:
+            _graph["graph"] = (
+                build_graph(recs, _user_names()) if not recs.empty else None
+            )
+            _graph["key"] = key
+        return _graph["graph"]
+
+
+def _neighbours(graph, nodes):
+    # Distinct neighbours of a set of nodes, straight from the CSR arrays
+    indptr = graph["indptr"]
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    counts = ends - starts
+    if not counts.sum():
+        return np.empty(0, dtype="int64")
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.unique(graph["indices"][np.repeat(starts, counts) + steps])
+
+
+def _edges_among(graph, nodes):
+    # Edges of the subgraph induced by `nodes`, each once
+    shown = np.zeros(len(graph["node_ids"]), dtype=bool)
+    shown[nodes] = True
+    indptr, indices = graph["indptr"], graph["indices"]
+    sources, targets = [], []
+    for node in nodes:
+        neighbours = indices[indptr[node] : indptr[node + 1]]
+        neighbours = neighbours[shown[neighbours] & (neighbours > node)]
+        sources.append(np.full(len(neighbours), node))
+        targets.append(neighbours)
+    if not sources:
+        return []
+    node_ids = graph["node_ids"]
+    return [
+        {"source": source, "target": target}
+        for source, target in zip(
+            node_ids[np.concatenate(sources)].tolist(),
+            node_ids[np.concatenate(targets)].tolist(),
+        )
+    ]
+
+
+def _node_records(graph, nodes, hops=None):
+    node_ids, types, degree = graph["node_ids"], graph["node_types"], graph["degree"]
+    names, users = graph["names"], len(graph["names"])
+    records = []
+    for node in np.asarray(nodes).tolist():
+        record = {
+            "id": node_ids[node],
+            "type": NODE_TYPES[types[node]],
+            "degree": int(degree[node]),
+        }
+        if node < users and pd.notna(names[node]):
+            record["name"] = names[node]
+        if hops is not None:
+            record["hop"] = int(hops[node])
+        records.append(record)
+    return records
+
+
+def _ranked(graph, nodes):
+    # Most connected first; node number breaks ties so pages are stable
+    return nodes[np.lexsort((nodes, -graph["degree"][nodes]))]
+
+
+def graph_neighbors(node_id, depth=1, start=0, length=100):
+    # Nodes within `depth` hops of one node, nearest hop first and most
+    # connected first within a hop, a page at a time. None for unknown nodes.
+    graph = get_graph()
+    if graph is None:
+        return None
+    center = graph["lookup"].get_indexer([node_id])[0]
+    if center < 0:
+        return None
+    depth = max(1, min(int(depth), GRAPH_MAX_DEPTH))
+    start = max(0, int(start))
+    length = max(0, min(int(length), GRAPH_MAX_NODES))
+
+    seen = np.zeros(len(graph["node_ids"]), dtype=bool)
+    seen[center] = True
+    frontier, hops = np.array([center]), []
+    for _ in range(depth):
+        frontier = _neighbours(graph, frontier)
+        frontier = frontier[~seen[frontier]]
+        seen[frontier] = True
+        hops.append(_ranked(graph, frontier))
+    ranked = np.concatenate(hops)
+    hop = np.zeros(len(seen), dtype="int64")
+    for distance, nodes in enumerate(hops, 1):
+        hop[nodes] = distance
+
+    page = ranked[start : start + length]
+    shown = np.concatenate([[center], page])
+    end = start + len(page)
+    return {
+        "node": _node_records(graph, [center])[0],
+        "depth": depth,
+        "nodes": _node_records(graph, page, hops=hop),
+        "edges": _edges_among(graph, shown),
+        "total": len(ranked),
+        "start": start,
+        "next_start": end if end < len(ranked) else None,
+    }
+
+
+def _user_groups_collapsed(graph, collapse):
+    # Users folded into one node per category (of the apps recommended to
+    # them) or per offer set; their app edges are summed into weights
+    users, apps, offers = graph["pairs"]
+    if collapse == "category":
+        keys = graph["app_categories"][apps - graph["offsets"][1]]
+    else:
+        keys = offers.astype("int64")
+    n = len(graph["node_ids"])
+    group_keys, sizes = np.unique(np.unique(keys * n + users) // n, return_counts=True)
+    edge_keys, weights = np.unique(keys * n + apps, return_counts=True)
+
+    def group_id(key):
+        if collapse == "category":
+            return f"group_{graph['node_ids'][key]}"
+        return f"group_offer_{key}"
+
+    def group_name(key):
+        if collapse == "category":
+            return graph["node_ids"][key][len(NODE_PREFIXES["category"]) :]
+        return " / ".join(OFFER_SETS[key])
+
+    groups = [
+        {
+            "id": group_id(key),
+            "type": "group",
+            "group": collapse,
+            "name": group_name(key),
+            "size": int(size),
+        }
+        for key, size in zip(group_keys.tolist(), sizes.tolist())
+    ]
+    edges = [
+        (group_id(key), app, int(weight))
+        for key, app, weight in zip(
+            (edge_keys // n).tolist(), (edge_keys % n).tolist(), weights.tolist()
+        )
+    ]
+    return groups, edges
+
+
+def graph_overview(limit=500, types=None, collapse=None):
+    # Initial view: the `limit` most connected nodes of the requested types
+    # and the edges between them. With `collapse`, users are replaced by
+    # group nodes so the view covers every user without drawing each one.
+    graph = get_graph()
+    if graph is None:
+        return None
+    types = list(types or NODE_TYPES)
+    unknown = [kind for kind in types if kind not in NODE_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown node types: {', '.join(unknown)}")
+    if collapse is not None and collapse not in GRAPH_COLLAPSE:
+        raise ValueError(f"Cannot collapse users by '{collapse}'")
+    limit = max(0, min(int(limit), GRAPH_MAX_NODES))
+
+    groups, group_edges = [], []
+    pool_types = [NODE_TYPES.index(kind) for kind in types]
+    if collapse is not None and "user" in types:
+        groups, group_edges = _user_groups_collapsed(graph, collapse)
+        groups = groups[:limit]
+        pool_types.remove(NODE_TYPES.index("user"))
+
+    pool = np.flatnonzero(np.isin(graph["node_types"], pool_types))
+    nodes = _ranked(graph, pool)[: limit - len(groups)]
+    shown = np.zeros(len(graph["node_ids"]), dtype=bool)
+    shown[nodes] = True
+    kept = {group["id"] for group in groups}
+    edges = _edges_among(graph, nodes) + [
+        {"source": group, "target": graph["node_ids"][app], "weight": weight}
+        for group, app, weight in group_edges
+        if group in kept and shown[app]
+    ]
+    return {
+        "nodes": groups + _node_records(graph, nodes),
+        "edges": edges,
+        "total_nodes": len(graph["node_ids"]),
+        "total_edges": graph["total_edges"],
+    }
@@ -0,0 +1,221 @@
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+from dataset_store import DERIVED_COLUMNS, dataset_tag, read_dataset
+from recommender import recommendations_snapshot, render_recommendations
+
+# Request filter key -> indexed column
+FILTER_COLUMNS = {
+    "region": "Region",
+    "age": "Age Group",
+    "category": "Category",
+    "offer": "Offer Code",
+}
+SORT_COLUMNS = [
+    "User ID",
+    "Recommended App",
+    "Category",
+    "Rating",
+    "Region",
+    "Age Group",
+]
+USER_DIMENSION_COLUMNS = ["ID", "Region", "Age"]
+QUERY_SCAN_ROWS = 65536  # Candidate rows tested per step while filling a page
+QUERY_MAX_PAGE = 1000
+
+_query_index = {"key": None, "index": None, "lock": Lock()}
+
+
+def _user_dimension():
+    # Region and Age Group per user, from their first row in the dataset
+    df = read_dataset(USER_DIMENSION_COLUMNS)
+    df = df[df["ID"].notna()].drop_duplicates("ID")
+    return pd.DataFrame(
+        {
+            "Region": df["Region"].to_numpy(),
+            "Age Group": DERIVED_COLUMNS["Age Group"](df).to_numpy(),
+        },
+        index=df["ID"].to_numpy("int64"),
+    )
+
+
+def _postings(codes, n_values):
+    # Inverted index: value code -> sorted row positions
+    order = np.argsort(codes, kind="stable").astype("int32")
+    bounds = np.searchsorted(codes[order], np.arange(n_values + 1))
+    return [order[bounds[i] : bounds[i + 1]] for i in range(n_values)]
+
+
+def build_query_index(recs):
+    # 🗃️ Recommendations joined with the user dimension, plus per-column codes,
+    # inverted indexes for the filters and a sort permutation per column
+    users = _user_dimension()
+    user_ids = recs["User ID"].to_numpy("int64", na_value=-1)
+    dimension = users.reindex(user_ids)
+    columns = {
+        "User ID": recs["User ID"],
+        "Recommended App": recs["Recommended App"],
+        "Category": recs["Category"],
+        "Rating": recs["Rating"],
+        "Offer Code": recs["Offer Code"],
+        "Region": dimension["Region"],
+        "Age Group": dimension["Age Group"],
+    }
+
+    codes, values, postings, order = {}, {}, {}, {}
+    for name, column in columns.items():
+        categorical = pd.Categorical(np.asarray(column, dtype=object))
+        codes[name] = categorical.codes.astype("int32")
+        values[name] = pd.Index(categorical.categories.astype(str))
+        if name in FILTER_COLUMNS.values():
+            postings[name] = _postings(codes[name], len(values[name]))
+        if name in SORT_COLUMNS:
+            # Categories are sorted, so code order is value order; NA (-1) first
+            order[name] = np.argsort(codes[name], kind="stable").astype("int32")
+
+    return {
+        "rows": len(recs),
+        "user_ids": user_ids,
+        "codes": codes,
+        "values": values,
+        "postings": postings,
+        "order": order,
+        "dimension": dimension.reset_index(drop=True),
+        "counts": {},
+    }
+
+
+def get_query_index():
+    # Rebuilt when the recommendations or the dataset change
+    version, recs = recommendations_snapshot()
+    key = (version, dataset_tag())
+    with _query_index["lock"]:
+        if _query_index["key"] != key:
+            _query_index["index"] = (
+                build_query_index(recs) if not recs.empty else None
+            )
+            _query_index["key"] = key
+        return _query_index["index"], recs
+
+
+def _value_code(index, column, value):
+    return index["values"][column].get_indexer([str(value)])[0]
+
+
+def _search_predicate(index, search):
+    # Substring match on app names (over the distinct names only), or an
+    # exact User ID when the search is numeric
+    apps = index["values"]["Recommended App"]
+    matched = np.flatnonzero(apps.str.contains(search, case=False, regex=False))
+    user_id = int(search) if search.isdigit() else None
+    app_codes = index["codes"]["Recommended App"]
+
+    def predicate(positions):
+        hit = np.isin(app_codes[positions], matched)
+        if user_id is not None:
+            hit |= index["user_ids"][positions] == user_id
+        return hit
+
+    return predicate
+
+
+def _plan(index, filters, search):
+    # -> (driver positions or None for "every row", [predicate, ...]);
+    # None when a filter value doesn't exist
+    driver, predicates = None, []
+    for key, column in FILTER_COLUMNS.items():
+        value = filters.get(key)
+        if value in (None, ""):
+            continue
+        code = _value_code(index, column, value)
+        if code < 0:
+            return None
+        posting = index["postings"][column][code]
+        if driver is None or len(posting) < len(driver):
+            driver = posting
+        column_codes = index["codes"][column]
+        predicates.append(lambda p, c=column_codes, v=code: c[p] == v)
+    if search:
+        predicates.append(_search_predicate(index, search))
+    return driver, predicates
+
+
+def _matches(positions, predicates):
+    keep = np.ones(len(positions), dtype=bool)
+    for predicate in predicates:
+        keep &= predicate(positions)
+    return positions[keep]
+
+
+def _count(index, filters, search, driver, predicates):
+    if not predicates:
+        return index["rows"]
+    if len(predicates) == 1 and driver is not None and not search:
+        return len(driver)  # A single filter is just its posting list
+    key = (tuple(sorted(filters.items())), search)
+    counts = index["counts"]
+    if key not in counts:
+        candidates = driver if driver is not None else np.arange(index["rows"])
+        counts[key] = len(_matches(candidates, predicates))
+    return counts[key]
+
+
+def _page_positions(index, driver, predicates, sort, descending, start, length):
+    # Walk candidates in output order, testing predicates a chunk at a time,
+    # until start + length matches are found
+    if sort is None:
+        candidates = driver  # Posting lists are already in row order
+    else:
+        candidates = index["order"][sort]
+        if descending:
+            candidates = candidates[::-1]
+    total = index["rows"] if candidates is None else len(candidates)
+
+    found, needed = [], start + length
+    collected = 0
+    for offset in range(0, total, QUERY_SCAN_ROWS):
+        if candidates is None:
+            chunk = np.arange(offset, min(offset + QUERY_SCAN_ROWS, total))
+        else:
+            chunk = candidates[offset : offset + QUERY_SCAN_ROWS]
+        chunk = _matches(chunk, predicates)
+        found.append(chunk)
+        collected += len(chunk)
+        if collected >= needed:
+            break
+    if not found:
+        return np.empty(0, dtype="int32")
+    return np.concatenate(found)[start:needed]
+
+
+def query_recommendations(
+    filters=None, search="", sort=None, descending=False, start=0, length=25
+):
+    # -> (rendered page, rows matching, total rows)
+    index, recs = get_query_index()
+    if index is None:
+        return pd.DataFrame(), 0, 0
+    if sort is not None and sort not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by '{sort}'")
+    filters = {key: filters[key] for key in FILTER_COLUMNS if filters and key in filters}
+    start = max(0, int(start))
+    length = max(0, min(int(length), QUERY_MAX_PAGE))
+    search = (search or "").strip()
+
+    plan = _plan(index, filters, search)
+    if plan is None:
+        return pd.DataFrame(), 0, index["rows"]
+    driver, predicates = plan
+
+    positions = _page_positions(
+        index, driver, predicates, sort, descending, start, length
+    )
+    page = render_recommendations(recs.iloc[positions].reset_index(drop=True))
+    page = page.assign(
+        Region=index["dimension"]["Region"].to_numpy()[positions],
+        **{"Age Group": index["dimension"]["Age Group"].to_numpy()[positions]},
+    )
+    matching = _count(index, filters, search, driver, predicates)
+    return page, matching, index["rows"]
@@ -1,115 +1,540 @@
+import json
+import multiprocessing
+import numpy as np
 import pandas as pd
 import os
+import tempfile
+import pyarrow as pa
+import pyarrow.compute as pc
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from threading import Lock
+from dataset_store import (
+    read_tagged_dataset,
+    dataset_row_count,
+    dataset_tag,
+    changed_user_ids,
+)
 
-RECOMMENDER_DATA_PATH = "Data/play_data.xlsx"
-RECOMMENDER_CACHE_PATH = "recommender_cache.pkl"
+# Arrow IPC (memory-mappable); the schema metadata carries the format version
+RECOMMENDER_CACHE_PATH = "recommender_cache.arrow"
+RECOMMENDER_CACHE_FORMAT = b"2"
+RECOMMENDER_INDEX_PATH = "recommender_app_index.parquet"
+# Dataset version/row count the cache was built from, readable without the cache
+RECOMMENDER_WATERMARK_PATH = "recommender_cache.meta.json"
 RECOMMENDER_MIN_ROWS = 1000  # Auto-trigger when file has >= this many rows
+RECOMMENDATION_COLUMNS = [
+    "User ID",
+    "Recommended App",
+    "Category",
+    "Rating",
+    "Reason Code",
+    "Total Spent",
+    "Offer Code",
+]
+RECOMMENDER_COLUMNS = [
+    "ID",
+    "App Name",
+    "Category",
+    "Sub_Category",
+    "Free/Paid",
+    "App/Game Price",
+    "Amount Spent on In-App Purchases",
+    "Session Count",
+    "Time Spent (min)",
+    "Rating",
+    "Play Pass User",
+]
 
 
-# 🔁 Recommender logic
-def generate_recommendations():
-    df = pd.read_excel(RECOMMENDER_DATA_PATH)
+SPEND_REASON = "Spent ${:.2f}. Play Pass could cut your monthly cost."
+FREE_USAGE_REASON = "High usage with free apps. Play Pass unlocks premium without ads."
+EARLY_SPENDER_REASON = "Engaged + starting to spend. Play Pass is a smarter deal early on."
+EXPLORER_REASON = "You explore many app types. Play Pass gives you freedom to try more."
+RECOMMENDED_APPS_PER_USER = 3
+
+# Recommendations carry small codes; text is rendered at the API/template edge.
+# Reason codes index REASONS (and REASON_OFFERS), offer codes index OFFER_SETS.
+REASONS = [SPEND_REASON, FREE_USAGE_REASON, EARLY_SPENDER_REASON, EXPLORER_REASON]
+OFFER_SETS = [
+    [
+        "🎁 30-day free Play Pass trial",
+        "💸 10% off next in-app purchase",
+        "📦 Bundle top 3 paid apps",
+    ],
+    [
+        "🚫 Ad-free version unlock",
+        "🎮 Free premium game gift",
+        "📲 Early access to top games",
+    ],
+    [
+        "🔍 Discovery pack trial",
+        "🆓 Weekly app rotation",
+        "🎉 1-month Play Pass at 50%",
+    ],
+    ["💡 Suggest manually"],
+]
+REASON_OFFERS = np.array([0, 1, 0, 2], dtype="int8")
+# Processes used for full runs; users are sharded across them by ID hash
+RECOMMENDER_WORKERS = int(os.environ.get("PLAYPASS_RECOMMENDER_WORKERS", 1))
+# Shard input is handed to workers as a memory-mapped Arrow file, in RAM
+# where available
+SHARD_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# "rules" (segment thresholds) or "cf" (item-item collaborative filtering)
+RECOMMENDER_ENGINE = os.environ.get("PLAYPASS_RECOMMENDER_ENGINE", "rules")
+CF_BLOCK_USERS = 4096  # Users scored per sparse block in the cf engine
+
+_app_index = {"tag": None, "index": None, "lock": Lock()}
+_recs_cache = {"stamp": None, "df": None, "lock": Lock()}
+
+
+def _top_categories(rows):
+    # Per-user mode of "Category"; ties go to the first value in sort order,
+    # exactly like Series.mode()[0]
+    counts = (
+        rows.groupby(["ID", "Category"], observed=True, sort=False)
+        .size()
+        .reset_index(name="count")
+        .sort_values(["ID", "count", "Category"], ascending=[True, False, True])
+    )
+    return counts.drop_duplicates("ID").set_index("ID")["Category"]
+
+
+def _user_profiles(non_play_pass):
+    # 📊 Spend, sessions and category breadth for every user in one pass
+    grouped = non_play_pass.groupby("ID")
+    profiles = pd.DataFrame(
+        {
+            "total_spent": grouped["Amount Spent on In-App Purchases"].sum()
+            + grouped["App/Game Price"].sum(),
+            "avg_sessions": grouped["Session Count"].mean(),
+            "categories_used": grouped["Category"].nunique(),
+        }
+    )
+    profiles["top_category"] = _top_categories(non_play_pass)
+    return profiles
+
+
+def _assign_reasons(profiles):
+    # 🧭 Segment & reason per user; the first matching rule wins
+    total_spent = profiles["total_spent"].to_numpy(dtype="float64", na_value=np.nan)
+    avg_sessions = profiles["avg_sessions"].to_numpy(dtype="float64", na_value=np.nan)
+    categories_used = profiles["categories_used"].to_numpy()
+
+    # ⛔ Skip users with no meaningful activity
+    active = ~((total_spent == 0) & (avg_sessions <= 3))
+    rules = [
+        total_spent > 5,
+        (total_spent == 0) & (avg_sessions > 5),
+        (1 < total_spent) & (total_spent <= 5) & (avg_sessions > 2),
+        categories_used > 3,
+    ]
+    segment = np.select(rules, np.arange(len(rules)), default=-1)
+    keep = active & (segment >= 0)  # Quiet users are skipped
+
+    return profiles[keep].assign(reason_code=segment[keep].astype("int8"))
+
 
+def build_app_index(df):
+    # 🗂️ Candidate index: every distinct top-rated paid app, ranked per
+    # category and per (category, sub-category) in dataset order, which is the
+    # order recommendations have always used.
+    paid_apps = df[
+        (df["Free/Paid"] == "Paid") & (df["Rating"] >= 4.0).fillna(False)
+    ][["App Name", "Category", "Sub_Category", "Rating"]].drop_duplicates()
+
+    first_in_category = ~paid_apps.duplicated(["App Name", "Category", "Rating"])
+    paid_apps["category_rank"] = (
+        paid_apps[first_in_category].groupby("Category", observed=True).cumcount()
+    )
+    paid_apps["sub_category_rank"] = paid_apps.groupby(
+        ["Category", "Sub_Category"], observed=True
+    ).cumcount()
+    return paid_apps.astype({"category_rank": "Int32", "sub_category_rank": "Int32"})
+
+
+def _save_app_index(index, tag):
+    table = pa.Table.from_pandas(index, preserve_index=False)
+    metadata = {**(table.schema.metadata or {}), b"dataset_tag": tag}
+    tmp_path = RECOMMENDER_INDEX_PATH + ".tmp"
+    pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+    os.replace(tmp_path, RECOMMENDER_INDEX_PATH)
+
+
+def _load_app_index(tag):
+    if not os.path.exists(RECOMMENDER_INDEX_PATH):
+        return None
+    metadata = pq.read_schema(RECOMMENDER_INDEX_PATH).metadata or {}
+    if metadata.get(b"dataset_tag") != tag.encode():
+        return None
+    return pq.read_table(RECOMMENDER_INDEX_PATH).to_pandas()
+
+
+def get_app_index(df=None, tag=None):
+    # Built once per dataset version; reused in-process and across restarts.
+    # A caller passing `df` passes the tag it was read at as well (see
+    # read_tagged_dataset()), so the index is never saved under a newer one.
+    if df is None:
+        tag = dataset_tag()
+    with _app_index["lock"]:
+        if _app_index["tag"] != tag:
+            index = _load_app_index(tag)
+            if index is None:
+                if df is None:
+                    tag, df = read_tagged_dataset(RECOMMENDER_COLUMNS)
+                index = build_app_index(df)
+                _save_app_index(index, tag)
+            _app_index["index"] = index
+            _app_index["tag"] = tag
+        return _app_index["index"]
+
+
+def _top_paid_apps(index, k=RECOMMENDED_APPS_PER_USER):
+    apps = index[index["category_rank"] < k]
+    return apps[["App Name", "Category", "Rating"]].assign(
+        rank=apps["category_rank"]
+    )
+
+
+def top_paid_apps(category, k=RECOMMENDED_APPS_PER_USER, sub_category=None):
+    # Top-k paid apps for a category (or one of its sub-categories)
+    index = get_app_index()
+    if sub_category is None:
+        apps = index[(index["Category"] == category) & index["category_rank"].notna()]
+        apps = apps.sort_values("category_rank").head(k)
+    else:
+        apps = index[
+            (index["Category"] == category) & (index["Sub_Category"] == sub_category)
+        ]
+        apps = apps.sort_values("sub_category_rank").head(k)
+    return apps[["App Name", "Category", "Sub_Category", "Rating"]].reset_index(
+        drop=True
+    )
+
+
+def _with_offer_codes(recs_df):
+    recs_df["Offer Code"] = REASON_OFFERS[recs_df["Reason Code"].to_numpy()]
+    return recs_df
+
+
+def _recommend(df, index):
     non_play_pass = df[df["Play Pass User"] == "No"]
-    recommendations = []
+    users = _assign_reasons(_user_profiles(non_play_pass))
 
-    for user_id, user_df in non_play_pass.groupby("ID"):
-        total_spent = (
-            user_df["Amount Spent on In-App Purchases"].sum()
-            + user_df["App/Game Price"].sum()
+    # Attach apps to users through their top category
+    recs_df = (
+        users.reset_index()[["ID", "top_category", "reason_code", "total_spent"]]
+        .merge(
+            _top_paid_apps(index),
+            left_on="top_category",
+            right_on="Category",
+            how="inner",
         )
-        avg_sessions = user_df["Session Count"].mean()
-        categories_used = user_df["Category"].nunique()
-
-        # ⛔ Skip users with no meaningful activity
-        if total_spent == 0 and avg_sessions <= 3:
-            continue
-
-        # 📊 Determine user segment & reason
-        if total_spent > 5:
-            reason = f"Spent ${total_spent:.2f}. Play Pass could cut your monthly cost."
-        elif total_spent == 0 and avg_sessions > 5:
-            reason = "High usage with free apps. Play Pass unlocks premium without ads."
-        elif 1 < total_spent <= 5 and avg_sessions > 2:
-            reason = (
-                "Engaged + starting to spend. Play Pass is a smarter deal early on."
-            )
-        elif categories_used > 3:
-            reason = (
-                "You explore many app types. Play Pass gives you freedom to try more."
-            )
+        .sort_values(["ID", "rank"], kind="stable")
+        .rename(
+            columns={
+                "ID": "User ID",
+                "App Name": "Recommended App",
+                "reason_code": "Reason Code",
+                "total_spent": "Total Spent",
+            }
+        )[RECOMMENDATION_COLUMNS[:-1]]
+        .reset_index(drop=True)
+    )
+    return _with_offer_codes(recs_df)
+
+
+def _interaction_matrix(df):
+    # 🧮 Sparse user x app implicit feedback: log-scaled time spent and
+    # sessions plus the rating, summed over a user's rows for the same app
+    user_codes, user_ids = pd.factorize(df["ID"])
+    app_codes, app_names = pd.factorize(df["App Name"])
+    time_spent = df["Time Spent (min)"].to_numpy("float64", na_value=0).clip(0)
+    sessions = df["Session Count"].to_numpy("float64", na_value=0).clip(0)
+    rating = df["Rating"].to_numpy("float64", na_value=0).clip(0)
+    signal = np.log1p(time_spent) + np.log1p(sessions) + rating / 5
+
+    keep = (user_codes >= 0) & (app_codes >= 0) & (signal > 0)
+    matrix = sp.csr_matrix(
+        (signal[keep], (user_codes[keep], app_codes[keep])),
+        shape=(len(user_ids), len(app_names)),
+    )
+    return matrix, pd.Index(user_ids), pd.Index(app_names)
+
+
+def _item_similarity(matrix):
+    # Cosine similarity between app columns; stays sparse (apps sharing users)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = matrix @ sp.diags(scale)
+    similarity = (normalized.T @ normalized).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    return similarity
+
+
+def _recommend_cf(df, index, k=RECOMMENDED_APPS_PER_USER):
+    # 🤝 Same users and reasons as the rule engine, but apps are ranked per
+    # user by similarity to what they already use. Users with no overlap at
+    # all keep their rule-engine apps.
+    rule_recs = _recommend(df, index)
+    users = _assign_reasons(_user_profiles(df[df["Play Pass User"] == "No"]))
+
+    matrix, user_index, app_index = _interaction_matrix(df)
+    candidates = (
+        index[index["category_rank"].notna()]
+        .drop_duplicates("App Name")[["App Name", "Category", "Rating"]]
+        .reset_index(drop=True)
+    )
+    columns = app_index.get_indexer(candidates["App Name"])
+    candidates = candidates[columns >= 0].reset_index(drop=True)
+    columns = columns[columns >= 0]
+    rows = user_index.get_indexer(users.index)
+    if candidates.empty or not len(rows):
+        return rule_recs
+
+    scorer = _item_similarity(matrix)[:, columns].tocsc()
+    used = matrix[:, columns].tocsr()
+    picked_users, picked_apps = [], []
+    for start in range(0, len(rows), CF_BLOCK_USERS):
+        block = rows[start : start + CF_BLOCK_USERS]
+        # Kept sparse throughout, so memory follows the interactions rather
+        # than users x candidates
+        scores = (matrix[block] @ scorer).tocsr()
+        scores = scores - scores.multiply(used[block] > 0)  # Already used
+        scores.data[scores.data < 0] = 0
+        scores.eliminate_zeros()
+
+        # Top k per row: sort entries by (row, -score), then keep each row's
+        # first k
+        entry_rows = np.repeat(np.arange(len(block)), np.diff(scores.indptr))
+        order = np.lexsort((scores.indices, -scores.data, entry_rows))
+        rank = np.arange(len(order)) - scores.indptr[entry_rows[order]]
+        keep = order[rank < k]
+        picked_users.append(start + entry_rows[keep])
+        picked_apps.append(scores.indices[keep])
+
+    picked_users = np.concatenate(picked_users)
+    picked_apps = np.concatenate(picked_apps)
+    apps = candidates.iloc[picked_apps].reset_index(drop=True)
+    cf_recs = pd.DataFrame(
+        {
+            "User ID": users.index[picked_users],
+            "Recommended App": apps["App Name"],
+            "Category": apps["Category"],
+            "Rating": apps["Rating"],
+            "Reason Code": users["reason_code"].to_numpy()[picked_users],
+            "Total Spent": users["total_spent"].to_numpy()[picked_users],
+        }
+    )
+    cf_recs = _with_offer_codes(cf_recs)
+
+    fallback = rule_recs[~rule_recs["User ID"].isin(cf_recs["User ID"])]
+    return (
+        pd.concat([cf_recs, fallback], ignore_index=True)
+        .sort_values("User ID", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+RECOMMENDER_ENGINES = {"rules": _recommend, "cf": _recommend_cf}
+
+
+def _shard_mask(ids, shard, shards):
+    return pd.util.hash_array(ids) % shards == shard
+
+
+def _recommend_shard(path, shard, shards, index):
+    # Runs in a worker process: map the shared file and materialize only this
+    # shard's rows
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+        ids = pc.fill_null(table.column("ID"), -1).to_numpy().astype("int64")
+        mask = _shard_mask(ids, shard, shards)
+        df = table.filter(pa.array(mask)).to_pandas()
+    return _recommend(df, index)
+
+
+def _recommend_parallel(df, index, workers):
+    fd, path = tempfile.mkstemp(suffix=".arrow", dir=SHARD_DIR)
+    os.close(fd)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+        # Never fork the caller: this runs on a job thread inside a threaded
+        # server, and a lock held by another thread at fork time would stay
+        # held in the child forever. Workers fork from a single-threaded fork
+        # server instead (spawn where there is none), with this module
+        # preloaded there.
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload([__name__])
         else:
-            continue  # Skip quiet users
-
-        # 🔍 Pick relevant top-rated paid apps
-        top_category = user_df["Category"].mode()[0]
-        paid_apps = (
-            df[
-                (df["Category"] == top_category)
-                & (df["Free/Paid"] == "Paid")
-                & (df["Rating"] >= 4.0)
-            ][["App Name", "Category", "Rating"]]
-            .drop_duplicates()
-            .head(3)
-        )
+            context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(_recommend_shard, path, shard, workers, index)
+                for shard in range(workers)
+            ]
+            # Collected in shard order; each user lives in exactly one shard
+            parts = [future.result() for future in futures]
+    finally:
+        os.remove(path)
 
-        for _, row in paid_apps.iterrows():
-            recommendations.append(
-                {
-                    "User ID": user_id,
-                    "Recommended App": row["App Name"],
-                    "Category": row["Category"],
-                    "Rating": row["Rating"],
-                    "Why Play Pass?": reason,
-                }
-            )
-    recs_df = pd.DataFrame(recommendations)
-    recs_df["Suggested Offers"] = recs_df["Why Play Pass?"].apply(suggest_offers)
+    return (
+        pd.concat(parts, ignore_index=True)
+        .sort_values("User ID", kind="stable")
+        .reset_index(drop=True)
+    )
 
-    recs_df.attrs["row_count"] = df.shape[0]
-    recs_df.to_pickle(RECOMMENDER_CACHE_PATH)
-    return recs_df
 
+def _category_apps(index):
+    # Per-category candidate lists, to tell which categories changed between runs
+    apps = _top_paid_apps(index)
+    return {
+        str(category): [[str(app), float(rating)] for app, rating in zip(
+            group["App Name"], group["Rating"]
+        )]
+        for category, group in apps.groupby("Category", observed=True)
+    }
 
-def suggest_offers(reason):
-    reason = reason.lower()
 
-    if any(keyword in reason for keyword in ["spent", "cost", "save", "smarter deal"]):
-        return [
-            "🎁 30-day free Play Pass trial",
-            "💸 10% off next in-app purchase",
-            "📦 Bundle top 3 paid apps",
-        ]
-    elif any(keyword in reason for keyword in ["usage", "premium", "ads", "unlock"]):
-        return [
-            "🚫 Ad-free version unlock",
-            "🎮 Free premium game gift",
-            "📲 Early access to top games",
-        ]
-    elif "explore" in reason or "freedom" in reason:
-        return [
-            "🔍 Discovery pack trial",
-            "🆓 Weekly app rotation",
-            "🎉 1-month Play Pass at 50%",
-        ]
+def _read_watermark():
+    if os.path.exists(RECOMMENDER_WATERMARK_PATH):
+        with open(RECOMMENDER_WATERMARK_PATH, "r") as f:
+            return json.load(f)
+    return None
+
+
+def _write_watermark(watermark):
+    tmp_path = RECOMMENDER_WATERMARK_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, RECOMMENDER_WATERMARK_PATH)
+
+
+def _users_to_update(watermark, cached, category_apps):
+    # None means "recompute everyone"
+    if watermark is None or cached.empty:
+        return None
+    if watermark.get("engine", "rules") != "rules":
+        return None
+    changed = changed_user_ids(watermark["dataset_tag"])
+    if changed is None:
+        return None
+
+    old_apps = watermark.get("category_apps", {})
+    changed_categories = {
+        category
+        for category in set(old_apps) | set(category_apps)
+        if old_apps.get(category) != category_apps.get(category)
+    }
+    if changed_categories - set(old_apps):
+        # Users of a category that had no candidates before aren't in the cache
+        return None
+    affected = cached.loc[
+        cached["Category"].astype(str).isin(changed_categories), "User ID"
+    ]
+    return np.union1d(changed, affected.to_numpy("int64"))
+
+
+# 🔁 Recommender logic
+def generate_recommendations(
+    incremental=True, workers=None, engine=None, progress=None
+):
+    # progress(stage=..., **fields), when given, reports each stage of the run
+    progress = progress or (lambda **fields: None)
+    engine = engine or RECOMMENDER_ENGINE
+    if engine not in RECOMMENDER_ENGINES:
+        raise ValueError(f"Unknown recommender engine '{engine}'")
+
+    progress(stage="reading")
+    # The tag of exactly these rows, for the app index and the watermark
+    tag, df = read_tagged_dataset(RECOMMENDER_COLUMNS)
+    # Plain float64 (NaN for missing) for the scoring arithmetic
+    spend_cols = ["Amount Spent on In-App Purchases", "App/Game Price"]
+    df[spend_cols] = df[spend_cols].astype("float64")
+
+    progress(stage="indexing", rows=df.shape[0])
+    index = get_app_index(df, tag)
+    category_apps = _category_apps(index)
+
+    users = None
+    if incremental and engine == "rules":
+        # Collaborative scores shift with every user's history, so only the
+        # rule engine can be updated per user
+        cached = get_cached_recommendations()
+        users = _users_to_update(_read_watermark(), cached, category_apps)
+
+    progress(stage="scoring", users=None if users is None else len(users))
+    workers = workers or RECOMMENDER_WORKERS
+    if engine != "rules":
+        recs_df = RECOMMENDER_ENGINES[engine](df, index)
+    elif users is None and workers > 1:
+        print(f"Sharded recommender run across {workers} processes.")
+        recs_df = _recommend_parallel(df, index, workers)
+    elif users is None:
+        recs_df = _recommend(df, index)
     else:
-        return ["💡 Suggest manually"]
+        # ♻️ Recompute only users touched since the last run and merge
+        print(f"Incremental recommender run for {len(users)} users.")
+        updated = _recommend(df[df["ID"].isin(users)], index)
+        kept = cached[~cached["User ID"].isin(users)]
+        recs_df = (
+            pd.concat([kept, updated], ignore_index=True)
+            .sort_values("User ID", kind="stable")
+            .reset_index(drop=True)
+        )
+
+    progress(stage="saving", recommendations=len(recs_df))
+    recs_df.attrs["row_count"] = df.shape[0]
+    recs_df.attrs["dataset_tag"] = tag
+    save_recommendations(recs_df)
+    _write_watermark(
+        {
+            "dataset_tag": tag,
+            "row_count": df.shape[0],
+            "engine": engine,
+            "category_apps": category_apps,
+        }
+    )
+    return recs_df
 
 
-# Add this to each row in recs_df
+def render_recommendations(recs_df):
+    # 🖋️ Codes -> "Why Play Pass?" text and "Suggested Offers" lists. Only
+    # call this on the rows about to be shown.
+    if recs_df.empty:
+        return recs_df
+    codes = recs_df["Reason Code"].to_numpy()
+    reasons = np.array(REASONS, dtype=object)[codes]
+    spenders = codes == 0
+    reasons[spenders] = [
+        SPEND_REASON.format(amount)
+        for amount in recs_df["Total Spent"].to_numpy()[spenders]
+    ]
+    offer_sets = np.empty(len(OFFER_SETS), dtype=object)
+    for code, offers in enumerate(OFFER_SETS):
+        offer_sets[code] = offers
+    return recs_df.drop(columns=["Reason Code", "Total Spent", "Offer Code"]).assign(
+        **{
+            "Why Play Pass?": reasons,
+            "Suggested Offers": offer_sets[recs_df["Offer Code"].to_numpy()],
+        }
+    )
 
 
 # ✅ Check if new rows should auto-trigger the model
 def should_trigger_recommender():
     try:
-        df = pd.read_excel(RECOMMENDER_DATA_PATH)
-        new_count = df.shape[0]
-
-        if os.path.exists(RECOMMENDER_CACHE_PATH):
-            cached = pd.read_pickle(RECOMMENDER_CACHE_PATH)
-            old_count = cached.attrs.get("row_count", 0)
-        else:
-            old_count = 0
+        # Store metadata and the watermark sidecar only; no data is read
+        new_count = dataset_row_count()
+        watermark = _read_watermark()
+        old_count = watermark["row_count"] if watermark else 0
 
         return (new_count - old_count) >= RECOMMENDER_MIN_ROWS
     except Exception as e:
@@ -117,8 +542,70 @@ def should_trigger_recommender():
         return False
 
 
+def _cache_stamp():
+    try:
+        stat = os.stat(RECOMMENDER_CACHE_PATH)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def save_recommendations(recs_df):
+    table = pa.Table.from_pandas(recs_df, preserve_index=False)
+    metadata = {
+        **(table.schema.metadata or {}),
+        b"format": RECOMMENDER_CACHE_FORMAT,
+        b"row_count": str(recs_df.attrs.get("row_count", 0)),
+        b"dataset_tag": recs_df.attrs.get("dataset_tag", ""),
+    }
+    tmp_path = RECOMMENDER_CACHE_PATH + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema.with_metadata(metadata)) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, RECOMMENDER_CACHE_PATH)
+
+    with _recs_cache["lock"]:
+        _recs_cache["df"] = recs_df.copy(deep=False)
+        _recs_cache["stamp"] = _cache_stamp()
+
+
+def _load_recommendations():
+    try:
+        with pa.memory_map(RECOMMENDER_CACHE_PATH, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+            recs_df = table.to_pandas()
+    except pa.ArrowInvalid as e:
+        print("Ignoring unreadable recommendation cache:", e)
+        return pd.DataFrame()
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"format") != RECOMMENDER_CACHE_FORMAT:
+        print("Ignoring recommendation cache written in another format.")
+        return pd.DataFrame()
+    recs_df.attrs["row_count"] = int(metadata[b"row_count"])
+    recs_df.attrs["dataset_tag"] = metadata[b"dataset_tag"].decode()
+    return recs_df
+
+
+def recommendations_version():
+    # Changes whenever the cache file is replaced; no data is read
+    return _cache_stamp()
+
+
+def recommendations_snapshot():
+    # (version, frame) read together; the version changes whenever the cache
+    # file is replaced
+    stamp = _cache_stamp()
+    with _recs_cache["lock"]:
+        if stamp != _recs_cache["stamp"] or _recs_cache["df"] is None:
+            _recs_cache["df"] = (
+                _load_recommendations() if stamp is not None else pd.DataFrame()
+            )
+            _recs_cache["stamp"] = stamp
+        # Shallow copy: Copy-on-Write keeps callers' edits off the shared frame
+        return _recs_cache["stamp"], _recs_cache["df"].copy(deep=False)
+
+
 # ✅ Get cached recommendations
 def get_cached_recommendations():
-    if os.path.exists(RECOMMENDER_CACHE_PATH):
-        return pd.read_pickle(RECOMMENDER_CACHE_PATH)
-    return pd.DataFrame()
+    # Held in memory; the file is only re-read after another process replaces it
+    return recommendations_snapshot()[1]
@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, make_response, request
+from werkzeug.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+RESPONSE_CACHE_BYTES = 64 * 1024 * 1024  # Serialized bodies kept in memory
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/vnd.apache.arrow")
+# Query arguments that differ on every request without changing the content:
+# DataTables' draw counter (echoed back in an X-Draw header, so cached bodies
+# are served as they are) and jQuery's cache-busting _=<timestamp>
+VOLATILE_ARGS = ("draw", "_")
+FIRST_SEEN_VERSIONS = 64
+
+_responses = OrderedDict()  # key -> entry
+_responses_lock = Lock()
+_cache_bytes = [0]
+_first_seen = OrderedDict()  # version -> time it was first served, for Last-Modified
+
+
+def _request_key(version):
+    # Route + query string + body + the versions the content depends on
+    digest = hashlib.sha1()
+    digest.update(request.path.encode())
+    for name, value in sorted(request.args.items(multi=True)):
+        if name in VOLATILE_ARGS:
+            continue
+        digest.update(f"\0{name}={value}".encode())
+    digest.update(b"\0" + request.get_data())
+    digest.update(f"\0{version}".encode())
+    return digest.hexdigest()
+
+
+def _first_served(version):
+    with _responses_lock:
+        if version not in _first_seen:
+            _first_seen[version] = int(time.time())
+            while len(_first_seen) > FIRST_SEEN_VERSIONS:
+                _first_seen.popitem(last=False)
+        return _first_seen[version]
+
+
+def _accepted_encoding(body_size, mimetype):
+    if body_size < COMPRESS_MIN_BYTES or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return "identity"
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return "identity"
+
+
+def _encode(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def _store(key, entry):
+    with _responses_lock:
+        old = _responses.pop(key, None)
+        if old is not None:
+            _cache_bytes[0] -= old["size"]
+        _responses[key] = entry
+        _cache_bytes[0] += entry["size"]
+        while _cache_bytes[0] > RESPONSE_CACHE_BYTES and len(_responses) > 1:
+            _, evicted = _responses.popitem(last=False)
+            _cache_bytes[0] -= evicted["size"]
+
+
+def _lookup(key):
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is not None:
+            _responses.move_to_end(key)
+        return entry
+
+
+def _encoded(key, entry, encoding):
+    # Each encoding is produced once per entry, on first request
+    body = entry["bodies"].get(encoding)
+    if body is None:
+        body = _encode(entry["bodies"]["identity"], encoding)
+        with _responses_lock:
+            entry["bodies"][encoding] = body
+            entry["size"] += len(body)
+            if key in _responses:
+                _cache_bytes[0] += len(body)
+    return body
+
+
+def clear_response_cache():
+    with _responses_lock:
+        _responses.clear()
+        _cache_bytes[0] = 0
+
+
+def cached_response(*version_sources):
+    # Caches a view's serialized 200 responses per (route, params, body,
+    # versions). version_sources are callables whose results change whenever
+    # the content may; they also drive ETag/Last-Modified and 304s. When one
+    # fails the view runs uncached, so its own error handling answers.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = "|".join(str(source()) for source in version_sources)
+            except Exception:
+                current_app.logger.exception(
+                    f"Version check for {request.path} failed; serving uncached"
+                )
+                return view(*args, **kwargs)
+            key = _request_key(version)
+            etag = key[:32]
+            modified = _first_served(version)
+
+            if request.method in ("GET", "HEAD"):
+                not_modified = (
+                    request.if_none_match.contains_weak(etag)
+                    if request.if_none_match
+                    else request.if_modified_since is not None
+                    and request.if_modified_since.timestamp() >= modified
+                )
+                if not_modified:
+                    response = make_response("", 304)
+                    response.set_etag(etag, weak=True)
+                    response.headers["Last-Modified"] = http_date(modified)
+                    return response
+
+            entry = _lookup(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = {
+                    "bodies": {"identity": body},
+                    "size": len(body),
+                    "mimetype": response.mimetype,
+                    "headers": [
+                        (name, value)
+                        for name, value in response.headers.items()
+                        if name.startswith("X-")
+                    ],
+                }
+                _store(key, entry)
+
+            identity = entry["bodies"]["identity"]
+            encoding = _accepted_encoding(len(identity), entry["mimetype"])
+            response = make_response(_encoded(key, entry, encoding))
+            response.mimetype = entry["mimetype"]
+            for name, value in entry["headers"]:
+                response.headers[name] = value
+            draw = request.args.get("draw", type=int)
+            if draw is not None:
+                response.headers["X-Draw"] = str(draw)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+            response.headers["Vary"] = "Accept-Encoding"
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.headers["Last-Modified"] = http_date(modified)
+            # Weak: the same content is sent with different encodings
+            response.set_etag(etag, weak=True)
+            return response
+
+        return wrapper
+
+    return decorator
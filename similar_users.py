@@ -0,0 +1,163 @@
+import json
+import os
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dataset_store import dataset_tag, read_tagged_dataset
+
+SIMILAR_USERS_INDEX_PATH = "similar_users_index.arrow"
+SIMILAR_USERS_COLUMNS = [
+    "ID",
+    "App/Game Price",
+    "Amount Spent on In-App Purchases",
+    "Session Count",
+    "Time Spent (min)",
+    "Category",
+    "Region",
+    "Device Type",
+    "Income Level",
+]
+# Categorical features, encoded as each user's share of rows per value
+SHARE_FEATURES = ["Category", "Region", "Device Type", "Income Level"]
+SIMILAR_BLOCK_ROWS = 262144  # Rows scored per block during a search
+SIMILAR_MAX_K = 100
+
+_index = {"tag": None, "ids": None, "features": None, "names": None, "lock": Lock()}
+
+
+def _share_block(codes, user_codes, n_users, categories):
+    counts = np.zeros((n_users, len(categories)), dtype="float32")
+    valid = codes >= 0
+    np.add.at(counts, (user_codes[valid], codes[valid]), 1)
+    totals = counts.sum(axis=1, keepdims=True)
+    np.divide(counts, totals, out=counts, where=totals > 0)
+    return counts
+
+
+def build_features(df):
+    # One row per user: z-scored log spend/sessions/time plus per-value shares
+    # of category, region, device and income, scaled to unit length so a dot
+    # product is a cosine similarity
+    df = df[df["ID"].notna()]
+    user_codes, ids = pd.factorize(df["ID"], sort=True)
+    n_users = len(ids)
+
+    spend = df["Amount Spent on In-App Purchases"].to_numpy(
+        "float64", na_value=0
+    ) + df["App/Game Price"].to_numpy("float64", na_value=0)
+    numeric = pd.DataFrame(
+        {
+            "spend": spend,
+            "sessions": df["Session Count"].to_numpy("float64", na_value=np.nan),
+            "time_spent": df["Time Spent (min)"].to_numpy("float64", na_value=np.nan),
+        }
+    ).groupby(user_codes)
+    numeric = pd.concat(
+        [numeric["spend"].sum(), numeric[["sessions", "time_spent"]].mean()], axis=1
+    )
+    numeric = np.log1p(numeric.clip(lower=0).fillna(0))
+    std = numeric.std(ddof=0).replace(0, 1)
+    numeric = ((numeric - numeric.mean()) / std / np.sqrt(numeric.shape[1])).to_numpy(
+        "float32"
+    )
+
+    blocks, names = [numeric], ["spend", "sessions", "time_spent"]
+    for column in SHARE_FEATURES:
+        values = df[column].astype("category")
+        categories = [str(value) for value in values.cat.categories]
+        blocks.append(
+            _share_block(values.cat.codes.to_numpy(), user_codes, n_users, categories)
+        )
+        names += [f"{column}={value}" for value in categories]
+
+    features = np.hstack(blocks)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    np.divide(features, norms, out=features, where=norms > 0)
+    return np.asarray(ids, dtype="int64"), np.ascontiguousarray(features), names
+
+
+def _save_index(ids, features, names, tag):
+    values = pa.array(features.ravel(), type=pa.float32())
+    table = pa.table(
+        {
+            "ID": pa.array(ids),
+            "features": pa.FixedSizeListArray.from_arrays(values, features.shape[1]),
+        }
+    ).replace_schema_metadata(
+        {b"dataset_tag": tag, b"feature_names": json.dumps(names)}
+    )
+    tmp_path = SIMILAR_USERS_INDEX_PATH + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, SIMILAR_USERS_INDEX_PATH)
+
+
+def _load_index(tag):
+    # Memory-mapped; the feature matrix is a zero-copy view of the file
+    if not os.path.exists(SIMILAR_USERS_INDEX_PATH):
+        return None
+    table = pa.ipc.open_file(pa.memory_map(SIMILAR_USERS_INDEX_PATH, "r")).read_all()
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"dataset_tag") != tag.encode():
+        return None
+    names = json.loads(metadata[b"feature_names"])
+    features = table.column("features").combine_chunks().flatten()
+    features = features.to_numpy(zero_copy_only=True).reshape(-1, len(names))
+    ids = table.column("ID").to_numpy()
+    return ids, features, names
+
+
+def get_similar_index():
+    # Rebuilt once per dataset version; reused in-process and across restarts
+    tag = dataset_tag()
+    with _index["lock"]:
+        if _index["tag"] != tag:
+            loaded = _load_index(tag)
+            if loaded is None:
+                print("Building similar-users index...")
+                # Saved under the tag of the rows read, which an append may
+                # have moved past the one checked above
+                tag, df = read_tagged_dataset(SIMILAR_USERS_COLUMNS)
+                loaded = build_features(df)
+                _save_index(*loaded, tag)
+            _index["ids"], _index["features"], _index["names"] = loaded
+            _index["tag"] = tag
+        return _index["ids"], _index["features"], _index["names"]
+
+
+def _search(features, query, k, exclude):
+    # Exact blocked brute force: keep a running top-k across row blocks
+    best_rows = np.empty(0, dtype="int64")
+    best_scores = np.empty(0, dtype="float32")
+    for start in range(0, len(features), SIMILAR_BLOCK_ROWS):
+        scores = features[start : start + SIMILAR_BLOCK_ROWS] @ query
+        if start <= exclude < start + len(scores):
+            scores[exclude - start] = -np.inf
+        rows = np.arange(start, start + len(scores))
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        best_rows = np.concatenate([best_rows, rows])
+        best_scores = np.concatenate([best_scores, scores])
+        if len(best_scores) > k:
+            top = np.argpartition(-best_scores, k - 1)[:k]
+            best_rows, best_scores = best_rows[top], best_scores[top]
+
+    order = np.lexsort((best_rows, -best_scores))
+    keep = np.isfinite(best_scores[order])
+    return best_rows[order][keep], best_scores[order][keep]
+
+
+def similar_users(user_id, k=10):
+    # [(ID, cosine similarity), ...] most similar first; None for unknown users
+    ids, features, _ = get_similar_index()
+    row = np.searchsorted(ids, user_id)
+    if row >= len(ids) or ids[row] != user_id:
+        return None
+    k = max(1, min(int(k), SIMILAR_MAX_K))
+    rows, scores = _search(features, features[row], k, row)
+    return [(int(ids[r]), round(float(score), 4)) for r, score in zip(rows, scores)]
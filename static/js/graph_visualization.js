@@ -1,128 +1,165 @@
 // Graph Visualization Module
+// The server decides what is drawn: an overview of the most connected nodes
+// (optionally with users folded into groups), then neighbourhoods fetched a
+// page at a time as nodes are expanded.
 let network = null;
-let allNodes = [];
-let allEdges = [];
-
-function applyGraphFilters() {
-    const nodeTypeFilter = Array.from(document.getElementById('nodeTypeFilter').selectedOptions)
-        .map(opt => opt.value);
-    const relationshipFilter = Array.from(document.getElementById('relationshipFilter').selectedOptions)
-        .map(opt => opt.value);
-    const nodeLimit = parseInt(document.getElementById('nodeLimit').value);
-    
-    // Filter nodes
-    const filteredNodes = allNodes.filter(node => 
-        nodeTypeFilter.includes(node.group)
-    ).slice(0, nodeLimit);
-    
-    // Filter edges based on both node visibility and relationship type
-    const visibleNodeIds = new Set(filteredNodes.map(n => n.id));
-    const filteredEdges = allEdges.filter(edge => {
-        // First check if both connected nodes are visible
-        if (!visibleNodeIds.has(edge.from) || !visibleNodeIds.has(edge.to)) {
-            return false;
-        }
-        
-        // Determine node types
-        const fromType = edge.from.startsWith('user_') ? 'user' : 
-                        edge.from.startsWith('app_') ? 'app' : 'category';
-        const toType = edge.to.startsWith('user_') ? 'user' : 
-                      edge.to.startsWith('app_') ? 'app' : 'category';
-        
-        // Check if this relationship type should be shown
-        const relationshipType = `${fromType}-${toType}`;
-        const reverseRelationshipType = `${toType}-${fromType}`;
-        
-        // Special case: user-category relationships may go through apps
-        if (relationshipFilter.includes('user-category') && 
-            ((fromType === 'user' && toType === 'app') || 
-             (fromType === 'app' && toType === 'category'))) {
-            return true;
-        }
-        
-        return relationshipFilter.includes(relationshipType) || 
-               relationshipFilter.includes(reverseRelationshipType);
-    });
+const graphNodes = new vis.DataSet();
+const graphEdges = new vis.DataSet();
+const nodeTypes = {}; // node id -> type, for relationship filtering
+const nextPage = {}; // node id -> start of its next neighbour page (null when done)
+const NEIGHBOR_PAGE = 50;
 
-    // Update the network
-    if (network) {
-        network.setData({
-            nodes: new vis.DataSet(filteredNodes),
-            edges: new vis.DataSet(filteredEdges)
-        });
-        
-        // Stabilize the network after filtering
-        network.stabilize(100);
+function selectedValues(id) {
+    return Array.from(document.getElementById(id).selectedOptions).map(opt => opt.value);
+}
+
+function relationshipOf(edge) {
+    // Groups stand in for users
+    const kind = id => (nodeTypes[id] === 'group' ? 'user' : nodeTypes[id]);
+    return [kind(edge.from), kind(edge.to)];
+}
+
+function edgeVisible(edge) {
+    const relationshipFilter = selectedValues('relationshipFilter');
+    const [fromType, toType] = relationshipOf(edge);
+    const known = ['user-app', 'app-category'];
+    const relationshipType = `${fromType}-${toType}`;
+    const reverseRelationshipType = `${toType}-${fromType}`;
+
+    // Other relationships (app-reason) have no filter of their own
+    if (!known.includes(relationshipType) && !known.includes(reverseRelationshipType)) {
+        return true;
     }
+    // Special case: user-category relationships go through apps
+    if (relationshipFilter.includes('user-category')) {
+        return true;
+    }
+    return relationshipFilter.includes(relationshipType) ||
+           relationshipFilter.includes(reverseRelationshipType);
 }
 
-function buildKnowledgeGraph(data) {
-    try {
-        // Store all nodes and edges for filtering
-        allNodes = data.graph.nodes.map(node => {
-            // Format labels differently based on node type
-            let label;
-            if (node.type === 'User') {
-                // For users, show their actual name from the data
-                const userId = node.id.replace('user_', '');
-                const userName = node.name || `User ${userId}`;
-                label = userName;
-            } else {
-                // For apps and categories, just show the name
-                label = node.id.replace(/^(app_|cat_)/, '');
-            }
-            
-            return {
-                id: node.id,
-                label: label,
-                group: node.type.toLowerCase(),
-                shape: node.type === 'User' ? 'dot' : 
-                       node.type === 'App' ? 'box' : 'diamond',
-                size: node.type === 'User' ? 20 : 
-                      node.type === 'App' ? 25 : 30,
-                // Store original ID for reference
-                originalId: node.id
-            };
-        });
+const visibleEdges = new vis.DataView(graphEdges, { filter: edgeVisible });
 
-        allEdges = data.graph.edges.map(edge => ({
-            from: edge.source,
-            to: edge.target,
-            label: edge.source.startsWith('user_') ? 'recommends' : 'belongs to'
-        }));
+function toVisNode(node) {
+    nodeTypes[node.id] = node.type;
+    let label;
+    if (node.type === 'user') {
+        // For users, show their actual name from the data
+        label = node.name || `User ${node.id.replace('user_', '')}`;
+    } else if (node.type === 'group') {
+        label = `${node.name} (${node.size} users)`;
+    } else {
+        // For apps, categories and reasons, just show the name
+        label = node.id.replace(/^(app_|cat_|reason_)/, '');
+    }
+
+    return {
+        id: node.id,
+        label: label,
+        group: node.type,
+        shape: node.type === 'user' ? 'dot' :
+               node.type === 'app' ? 'box' :
+               node.type === 'group' ? 'hexagon' : 'diamond',
+        size: node.type === 'group' ? 20 + 5 * Math.log2(node.size + 1) :
+              node.type === 'user' ? 20 :
+              node.type === 'app' ? 25 : 30,
+        title: node.degree !== undefined ? `${node.degree} connections` : undefined
+    };
+}
 
-        // Apply initial filters
+function toVisEdge(edge) {
+    return {
+        id: `${edge.source}|${edge.target}`,
+        from: edge.source,
+        to: edge.target,
+        label: edge.weight !== undefined ? `${edge.weight} users` :
+               edge.source.startsWith('user_') ? 'recommends' : 'belongs to',
+        value: edge.weight
+    };
+}
+
+function ensureNetwork() {
+    if (!network) {
         const container = document.getElementById('knowledgeGraph');
-        const filteredNodes = allNodes.slice(0, 500); // Initial limit of 500 nodes
-        const visibleNodeIds = new Set(filteredNodes.map(n => n.id));
-        const filteredEdges = allEdges.filter(edge => 
-            visibleNodeIds.has(edge.from) && visibleNodeIds.has(edge.to)
+        network = new vis.Network(
+            container,
+            { nodes: graphNodes, edges: visibleEdges },
+            networkOptions
         );
-
-        // Create the network data
-        const graphData = {
-            nodes: new vis.DataSet(filteredNodes),
-            edges: new vis.DataSet(filteredEdges)
-        };
-
-        // Show loading state
-        document.getElementById('graphLoader').style.display = 'flex';
-
-        // Create the network with a slight delay to allow loading state to show
-        return setTimeout(() => {
-            network = new vis.Network(container, graphData, networkOptions);
-            document.getElementById('graphLoader').style.display = 'none';
-            return network;
-        }, 100);
-
-    } catch (error) {
-        console.error('Error in buildKnowledgeGraph:', error);
-        throw error;
+        network.on('doubleClick', params => {
+            if (params.nodes.length === 1) expandNode(params.nodes[0]);
+        });
     }
+    return network;
 }
 
-// Export the build function for use in the template
-window.buildKnowledgeGraph = buildKnowledgeGraph;
+function setLoading(loading) {
+    document.getElementById('graphLoader').style.display = loading ? 'flex' : 'none';
+}
+
+function showError(message) {
+    document.getElementById('graphLoader').innerHTML = `
+        <div class="alert alert-danger">${message}</div>
+    `;
+    setLoading(true);
+}
+
+function loadGraphOverview() {
+    const params = new URLSearchParams({
+        limit: document.getElementById('nodeLimit').value,
+        types: selectedValues('nodeTypeFilter').join(',')
+    });
+    const collapse = document.getElementById('collapseUsers').value;
+    if (collapse) params.set('collapse', collapse);
+
+    setLoading(true);
+    return fetch(`/api/graph/overview?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            graphNodes.clear();
+            graphEdges.clear();
+            Object.keys(nextPage).forEach(id => delete nextPage[id]);
+            graphNodes.add(data.nodes.map(toVisNode));
+            graphEdges.add(data.edges.map(toVisEdge));
+            ensureNetwork().stabilize(50);
+            setLoading(false);
+        })
+        .catch(error => {
+            console.error('Error loading graph data:', error);
+            showError('Error loading graph visualization. Please try refreshing the page.');
+        });
+}
+
+function expandNode(nodeId) {
+    // Groups are summaries; there is no single node behind them to expand
+    if (nodeTypes[nodeId] === 'group' || nextPage[nodeId] === null) return;
+    const params = new URLSearchParams({
+        node: nodeId,
+        depth: 1,
+        start: nextPage[nodeId] || 0,
+        length: NEIGHBOR_PAGE
+    });
+
+    fetch(`/api/graph/neighbors?${params}`)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            graphNodes.update(data.nodes.map(toVisNode));
+            graphEdges.update(data.edges.map(toVisEdge));
+            nextPage[nodeId] = data.next_start;
+            const shown = data.next_start === null ? data.total : data.next_start;
+            graphNodes.update({
+                id: nodeId,
+                title: `${shown} of ${data.total} neighbours shown` +
+                       (data.next_start === null ? '' : ' (double-click for more)')
+            });
+        })
+        .catch(error => console.error(`Error expanding ${nodeId}:`, error));
+}
+
+// Export the loader for use in the template
+window.loadGraphOverview = loadGraphOverview;
 
 // Initialize filter controls
 document.addEventListener('DOMContentLoaded', function() {
@@ -131,24 +168,25 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('nodeLimitValue').textContent = this.value;
     });
 
-    // Apply filters button
-    document.getElementById('applyFilters').addEventListener('click', function() {
-        document.getElementById('graphLoader').style.display = 'flex';
-        setTimeout(() => {
-            applyGraphFilters();
-            document.getElementById('graphLoader').style.display = 'none';
-        }, 100);
+    // Node types, limit and grouping are applied by the server
+    document.getElementById('applyFilters').addEventListener('click', loadGraphOverview);
+
+    // Relationships only filter what is already loaded
+    document.getElementById('relationshipFilter').addEventListener('change', () => {
+        visibleEdges.refresh();
     });
 
     // Reset filters button
     document.getElementById('resetFilters').addEventListener('click', function() {
         Array.from(document.getElementById('nodeTypeFilter').options)
-            .forEach(opt => opt.selected = true);
+            .forEach(opt => opt.selected = opt.value !== 'reason');
         Array.from(document.getElementById('relationshipFilter').options)
             .forEach(opt => opt.selected = true);
+        document.getElementById('collapseUsers').value = '';
         document.getElementById('nodeLimit').value = 500;
         document.getElementById('nodeLimitValue').textContent = '500';
-        applyGraphFilters();
+        visibleEdges.refresh();
+        loadGraphOverview();
     });
 });
 
@@ -171,6 +209,10 @@ const networkOptions = {
             enabled: true,
             type: 'continuous'
         },
+        scaling: {
+            min: 1,
+            max: 8
+        },
         selectionWidth: 0 // Improves performance
     },
     groups: {
@@ -178,6 +220,10 @@ const networkOptions = {
             color: '#E57373',
             font: { color: '#D32F2F' }
         },
+        group: {
+            color: '#EF9A9A',
+            font: { color: '#B71C1C' }
+        },
         app: {
             color: '#81C784',
             font: { color: '#2E7D32' }
@@ -185,6 +231,10 @@ const networkOptions = {
         category: {
             color: '#64B5F6',
             font: { color: '#1565C0' }
+        },
+        reason: {
+            color: '#FFD54F',
+            font: { color: '#F57F17' }
         }
     },
     physics: {
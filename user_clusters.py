@@ -0,0 +1,218 @@
+import json
+import os
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from dataset_store import dataset_tag, read_tagged_dataset
+from similar_users import SHARE_FEATURES, SIMILAR_USERS_COLUMNS, build_features
+
+USER_CLUSTERS_PATH = "user_clusters.arrow"
+CLUSTER_COUNT = int(os.environ.get("PLAYPASS_CLUSTERS", 5))
+CLUSTER_BATCH_ROWS = 4096  # Users per mini-batch update
+CLUSTER_ITERATIONS = 200
+CLUSTER_SEED = 0  # Same data, same clusters
+CLUSTER_BLOCK_ROWS = 262144  # Users labelled per block in the final pass
+
+# Requests read whatever was fitted last under "lock"; fitting happens in the
+# refresh jobs under "build_lock", so a request never waits on it
+_clusters = {
+    "tag": None,
+    "ids": None,
+    "labels": None,
+    "profiles": None,
+    "lock": Lock(),
+    "build_lock": Lock(),
+}
+
+
+def _nearest(points, centers):
+    # argmin |x - c|^2 == argmin |c|^2 - 2 x.c (|x|^2 is the same for every c)
+    return np.argmin((centers**2).sum(axis=1) - 2 * points @ centers.T, axis=1)
+
+
+def _init_centers(features, k, rng):
+    # k-means++ seeding on a bounded sample
+    sample = features[rng.integers(0, len(features), CLUSTER_BATCH_ROWS * 4)]
+    centers = [sample[rng.integers(len(sample))]]
+    distances = ((sample - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = distances.sum()
+        p = distances / total if total > 0 else None
+        centers.append(sample[rng.choice(len(sample), p=p)])
+        distances = np.minimum(distances, ((sample - centers[-1]) ** 2).sum(axis=1))
+    return np.array(centers, dtype="float64")
+
+
+def minibatch_kmeans(features, k=CLUSTER_COUNT):
+    # Sculley-style mini-batch k-means: memory stays at one batch plus the
+    # centers no matter how many users there are
+    k = min(k, len(features))
+    if k == 0:
+        return np.empty((0, features.shape[1])), np.empty(0, dtype="int16")
+    rng = np.random.default_rng(CLUSTER_SEED)
+    centers = _init_centers(features, k, rng)
+    counts = np.zeros(k)
+
+    for _ in range(CLUSTER_ITERATIONS):
+        batch = features[rng.integers(0, len(features), CLUSTER_BATCH_ROWS)]
+        labels = _nearest(batch, centers)
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, batch)
+
+        counts += batch_counts
+        hit = batch_counts > 0
+        rate = (batch_counts[hit] / counts[hit])[:, None]
+        centers[hit] += rate * (sums[hit] / batch_counts[hit][:, None] - centers[hit])
+
+    labels = np.concatenate(
+        [
+            _nearest(features[start : start + CLUSTER_BLOCK_ROWS], centers)
+            for start in range(0, len(features), CLUSTER_BLOCK_ROWS)
+        ]
+    )
+    return centers, labels.astype("int16")
+
+
+def _profiles(df, ids, labels, centers, names):
+    # Size, average spend/sessions/time and the dominant category, region,
+    # device and income of every cluster; `df` is the read the features
+    # were built from
+    df = df[df["ID"].notna()]
+    spend = df["Amount Spent on In-App Purchases"].astype("float64").fillna(
+        0
+    ) + df["App/Game Price"].astype("float64").fillna(0)
+    grouped = df.assign(spend=spend).groupby("ID")
+    users = pd.DataFrame(
+        {
+            "avg_spend": grouped["spend"].sum(),
+            "avg_sessions": grouped["Session Count"].mean(),
+            "avg_time_spent": grouped["Time Spent (min)"].mean(),
+        }
+    ).reindex(ids)
+    stats = users.assign(cluster=labels).groupby("cluster").mean()
+    sizes = np.bincount(labels, minlength=len(centers))
+
+    names = np.array(names)
+    profiles = []
+    for cluster, center in enumerate(centers):
+        top = {}
+        for column in SHARE_FEATURES:
+            block = np.flatnonzero(np.char.startswith(names, f"{column}="))
+            if len(block):
+                best = names[block[np.argmax(center[block])]]
+                top[column] = best.split("=", 1)[1]
+        row = stats.loc[cluster] if cluster in stats.index else None
+        profiles.append(
+            {
+                "cluster": cluster,
+                "size": int(sizes[cluster]),
+                **{
+                    key: (
+                        round(float(row[key]), 2)
+                        if row is not None and pd.notna(row[key])
+                        else None
+                    )
+                    for key in ["avg_spend", "avg_sessions", "avg_time_spent"]
+                },
+                "top": top,
+            }
+        )
+    return profiles
+
+
+def _save_clusters(ids, labels, centers, profiles, tag):
+    table = pa.table({"ID": pa.array(ids), "cluster": pa.array(labels)})
+    table = table.replace_schema_metadata(
+        {
+            b"dataset_tag": tag,
+            b"centers": json.dumps(centers.tolist()),
+            b"profiles": json.dumps(profiles),
+        }
+    )
+    tmp_path = USER_CLUSTERS_PATH + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, USER_CLUSTERS_PATH)
+
+
+def _load_clusters(tag=None):
+    # The saved clusters of `tag`, or of whichever version was saved last
+    if not os.path.exists(USER_CLUSTERS_PATH):
+        return None
+    table = pa.ipc.open_file(pa.memory_map(USER_CLUSTERS_PATH, "r")).read_all()
+    metadata = table.schema.metadata or {}
+    if tag is not None and metadata.get(b"dataset_tag") != tag.encode():
+        return None
+    ids = table.column("ID").to_numpy()
+    labels = table.column("cluster").to_numpy()
+    saved_tag = metadata[b"dataset_tag"].decode()
+    return saved_tag, ids, labels, json.loads(metadata[b"profiles"])
+
+
+def _fit_clusters():
+    # Features and profiles come from one read, saved under that read's tag
+    tag, df = read_tagged_dataset(SIMILAR_USERS_COLUMNS)
+    print("Clustering users...")
+    ids, features, names = build_features(df)
+    centers, labels = minibatch_kmeans(features)
+    profiles = _profiles(df, ids, labels, centers, names)
+    _save_clusters(ids, labels, centers, profiles, tag)
+    return tag, ids, labels, profiles
+
+
+def refresh_clusters():
+    # Fits the clusters of the current dataset version, or loads them when
+    # saved by an earlier run. Called from the refresh and upload jobs.
+    with _clusters["build_lock"]:
+        tag = dataset_tag()
+        if _clusters["tag"] != tag:
+            loaded = _load_clusters(tag) or _fit_clusters()
+            with _clusters["lock"]:
+                (
+                    _clusters["tag"],
+                    _clusters["ids"],
+                    _clusters["labels"],
+                    _clusters["profiles"],
+                ) = loaded
+    return get_clusters()
+
+
+def get_clusters():
+    # The clusters fitted last, possibly of an older dataset version (see
+    # clusters_stale()); empty before the first fit. Never fits.
+    with _clusters["lock"]:
+        if _clusters["tag"] is None:
+            loaded = _load_clusters()
+            if loaded is None:
+                return np.empty(0, dtype="int64"), np.empty(0, dtype="int16"), []
+            (
+                _clusters["tag"],
+                _clusters["ids"],
+                _clusters["labels"],
+                _clusters["profiles"],
+            ) = loaded
+        return _clusters["ids"], _clusters["labels"], _clusters["profiles"]
+
+
+def clusters_stale():
+    get_clusters()
+    return _clusters["tag"] != dataset_tag()
+
+
+def cluster_profiles():
+    return get_clusters()[2]
+
+
+def clusters_of(user_ids):
+    # Cluster label per user ID; -1 for users the clustering hasn't seen
+    ids, labels, _ = get_clusters()
+    user_ids = np.asarray(user_ids, dtype="int64")
+    rows = np.searchsorted(ids, user_ids).clip(0, max(len(ids) - 1, 0))
+    if not len(ids):
+        return np.full(len(user_ids), -1, dtype="int16")
+    return np.where(ids[rows] == user_ids, labels[rows], -1).astype("int16")